@@ -0,0 +1,283 @@
+import abc
+import asyncio
+import json
+import os
+
+import aiohttp
+
+from .metrics import BACKEND_FAILOVERS, BACKEND_HEALTHY, BACKEND_OUTSTANDING
+
+# Comma separated Ollama hosts, generations are spread across all of them
+OLLAMA_URLS = os.getenv(
+    "OLLAMA_URLS", os.getenv("OLLAMA_URL", "http://localhost:11434")
+)
+# Seconds between health checks of every backend in a pool
+BACKEND_HEALTH_INTERVAL = float(os.getenv("BACKEND_HEALTH_INTERVAL", "10"))
+
+# Errors that mean "this host is down or overloaded", worth trying another one
+FAILOVER_ERRORS = (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+
+
+class Backend(abc.ABC):
+    """Text generation backend with Ollama's /api/generate semantics.
+
+    generate() returns the final response dict ("response" plus any eval
+    stats). stream() yields response chunks and the last one has "done"
+    set. Closing the stream early aborts the generation. Backends that can
+    embed text set supports_embeddings and implement embed().
+    """
+
+    name = "backend"
+    supports_embeddings = False
+
+    @abc.abstractmethod
+    async def generate(self, payload):
+        """Return the final response dict of one generation"""
+
+    async def embed(self, model, text):
+        """Return the embedding vector of text"""
+        raise NotImplementedError(f"{self.name} can't embed text")
+
+    async def stream(self, payload):
+        # Backends that can't stream produce the whole response as one chunk
+        result = await self.generate(payload)
+        yield {**result, "done": True}
+
+    async def health(self):
+        """Return True if the backend can take requests"""
+        return True
+
+    async def close(self):
+        pass
+
+
+class OllamaBackend(Backend):
+    """One Ollama host behind a shared keep-alive HTTP session."""
+
+    supports_embeddings = True
+
+    def __init__(
+        self,
+        base_url,
+        max_connections=4,
+        keepalive_timeout=60.0,
+        request_timeout=120.0,
+    ):
+        self.base_url = base_url.rstrip("/")
+        self.name = self.base_url
+        self.max_connections = max_connections
+        self.keepalive_timeout = keepalive_timeout
+        self.request_timeout = request_timeout
+        self._session = None
+
+    def _get_session(self):
+        """Return the shared keep-alive HTTP session, creating it on first use"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.max_connections,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.request_timeout),
+            )
+        return self._session
+
+    async def generate(self, payload):
+        async with self._get_session().post(
+            f"{self.base_url}/api/generate", json={**payload, "stream": False}
+        ) as response:
+            response.raise_for_status()
+            return await response.json()
+
+    async def embed(self, model, text):
+        async with self._get_session().post(
+            f"{self.base_url}/api/embeddings", json={"model": model, "prompt": text}
+        ) as response:
+            response.raise_for_status()
+            return (await response.json())["embedding"]
+
+    async def stream(self, payload):
+        done = False
+        async with self._get_session().post(
+            f"{self.base_url}/api/generate", json={**payload, "stream": True}
+        ) as response:
+            response.raise_for_status()
+            try:
+                async for line in response.content:
+                    if not line.strip():
+                        continue
+                    chunk = json.loads(line)
+                    done = chunk.get("done", False)
+                    yield chunk
+                    if done:
+                        break
+            finally:
+                # Closing the connection mid-stream makes Ollama abort the
+                # generation server-side instead of decoding into the void
+                if not done:
+                    response.close()
+
+    async def health(self):
+        try:
+            async with self._get_session().get(
+                f"{self.base_url}/api/version",
+                timeout=aiohttp.ClientTimeout(total=2),
+            ) as response:
+                return response.status == 200
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            return False
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+
+def _is_failover_error(error):
+    if isinstance(error, aiohttp.ClientResponseError):
+        return error.status >= 500
+    return isinstance(error, FAILOVER_ERRORS)
+
+
+class BackendPool(Backend):
+    """Spreads requests over several backends and fails over between them.
+
+    Each request goes to the healthy backend with the fewest requests in
+    flight. A backend that fails with a connection error, timeout or 5xx is
+    marked unhealthy and the request is retried on the next one. A background
+    task health checks every backend so the ones that come back rejoin the
+    pool.
+    """
+
+    name = "pool"
+
+    def __init__(self, backends, health_interval=BACKEND_HEALTH_INTERVAL):
+        self.backends = list(backends)
+        self.health_interval = health_interval
+        self.outstanding = {backend: 0 for backend in self.backends}
+        self.healthy = {backend: True for backend in self.backends}
+        self._requests = {backend: 0 for backend in self.backends}
+        self._health_task = None
+        # Embeddings fail over like generations, so every backend needs them
+        self.supports_embeddings = all(b.supports_embeddings for b in self.backends)
+        for backend in self.backends:
+            BACKEND_OUTSTANDING.set_function(
+                lambda backend=backend: self.outstanding[backend],
+                backend=backend.name,
+            )
+            BACKEND_HEALTHY.set_function(
+                lambda backend=backend: int(self.healthy[backend]),
+                backend=backend.name,
+            )
+
+    def _start_health_checks(self):
+        if self._health_task is None or self._health_task.done():
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _health_loop(self):
+        while True:
+            await self.check_health()
+            await asyncio.sleep(self.health_interval)
+
+    async def check_health(self):
+        """Health check every backend now, returns {name: healthy}"""
+        results = await asyncio.gather(
+            *(backend.health() for backend in self.backends),
+            return_exceptions=True,
+        )
+        for backend, result in zip(self.backends, results):
+            self.healthy[backend] = result is True
+        return {backend.name: self.healthy[backend] for backend in self.backends}
+
+    def _pick(self, tried):
+        """Least outstanding requests among the healthy, untried backends"""
+        candidates = [b for b in self.backends if b not in tried]
+        healthy = [b for b in candidates if self.healthy[b]]
+        # With every backend marked down, trying one beats failing outright
+        candidates = healthy or candidates
+        if not candidates:
+            return None
+        # Ties go to the backend that has served the fewest requests overall
+        return min(
+            candidates, key=lambda b: (self.outstanding[b], self._requests[b])
+        )
+
+    def _failed(self, backend, error):
+        print(f"Backend {backend.name} failed, failing over: {error}")
+        self.healthy[backend] = False
+        BACKEND_FAILOVERS.inc(backend=backend.name)
+
+    async def _call(self, method, *args):
+        """Run backend.method(*args) on the best backend, failing over"""
+        self._start_health_checks()
+        tried = set()
+        while True:
+            backend = self._pick(tried)
+            tried.add(backend)
+            self.outstanding[backend] += 1
+            self._requests[backend] += 1
+            try:
+                return await getattr(backend, method)(*args)
+            except Exception as e:
+                if not _is_failover_error(e) or len(tried) == len(self.backends):
+                    raise
+                self._failed(backend, e)
+            finally:
+                self.outstanding[backend] -= 1
+
+    async def generate(self, payload):
+        return await self._call("generate", payload)
+
+    async def embed(self, model, text):
+        return await self._call("embed", model, text)
+
+    async def stream(self, payload):
+        self._start_health_checks()
+        tried = set()
+        while True:
+            backend = self._pick(tried)
+            tried.add(backend)
+            self.outstanding[backend] += 1
+            self._requests[backend] += 1
+            started = False
+            stream = backend.stream(payload)
+            try:
+                async for chunk in stream:
+                    started = True
+                    yield chunk
+                return
+            except Exception as e:
+                # Once text has reached the caller the request can't be replayed
+                if (
+                    started
+                    or not _is_failover_error(e)
+                    or len(tried) == len(self.backends)
+                ):
+                    raise
+                self._failed(backend, e)
+            finally:
+                await stream.aclose()
+                self.outstanding[backend] -= 1
+
+    async def health(self):
+        return any((await self.check_health()).values())
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+        await asyncio.gather(*(backend.close() for backend in self.backends))
+
+
+def create_backend(urls=OLLAMA_URLS, **options):
+    """OllamaBackend for one URL, a BackendPool of them for several
+
+    urls is a list or a comma separated string, options are passed to each
+    OllamaBackend.
+    """
+    if isinstance(urls, str):
+        urls = [url.strip() for url in urls.split(",") if url.strip()]
+    backends = [OllamaBackend(url, **options) for url in urls]
+    if len(backends) == 1:
+        return backends[0]
+    return BackendPool(backends)
@@ -0,0 +1,83 @@
+import asyncio
+import json
+import time
+
+# Keys a batch line may use for its topic, in order of preference
+TOPIC_KEYS = ("topic", "prompt", "text")
+
+
+def read_topics(path):
+    """Yield (id, topic, error) for each line of a JSONL file, reading lazily
+
+    Lines may be objects with a topic/prompt/text key and an optional id, or
+    plain JSON strings. Lines without an id are numbered from 1. A line that
+    can't be used yields its error message and no topic, so one bad line
+    doesn't stop the batch.
+    """
+    with open(path) as f:
+        for line_number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield line_number, None, f"Line {line_number} is not valid JSON: {e}"
+                continue
+            if isinstance(item, str):
+                yield line_number, item, None
+                continue
+            if not isinstance(item, dict):
+                yield line_number, None, f"Line {line_number} is not a topic"
+                continue
+            item_id = item.get("id", line_number)
+            topic = next((item[key] for key in TOPIC_KEYS if item.get(key)), None)
+            if topic is None:
+                yield item_id, None, f"Line {line_number} has no topic"
+                continue
+            yield item_id, topic, None
+
+
+async def run_batch(topics, process, output_path, concurrency=4):
+    """Run process(topic) over (id, topic, error) items, concurrency at a time
+
+    Each result is appended to output_path as one JSON line as soon as it
+    finishes, so a partial run still leaves usable output. Failures are
+    recorded on their line instead of stopping the batch. Returns
+    (succeeded, failed).
+    """
+    topics = iter(topics)
+    counts = {"ok": 0, "error": 0}
+
+    with open(output_path, "w") as output:
+
+        async def worker():
+            # Workers pull from the shared iterator, so the file is never
+            # read further ahead than the lines currently being processed
+            while True:
+                try:
+                    item_id, topic, error = next(topics)
+                except StopIteration:
+                    return
+                except Exception as e:
+                    # The input itself broke (e.g. undecodable bytes), the
+                    # iterator is done but what was written so far stays
+                    item_id, topic, error = None, None, f"Failed to read input: {e}"
+                start = time.perf_counter()
+                record = {"id": item_id, "topic": topic}
+                try:
+                    if error is not None:
+                        raise ValueError(error)
+                    record.update(await process(topic))
+                    record["status"] = "ok"
+                except Exception as e:
+                    record["status"] = "error"
+                    record["error"] = str(e) or type(e).__name__
+                record["seconds"] = round(time.perf_counter() - start, 3)
+                counts[record["status"]] += 1
+                output.write(json.dumps(record) + "\n")
+                output.flush()
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+    return counts["ok"], counts["error"]
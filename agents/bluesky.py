@@ -0,0 +1,304 @@
+import asyncio
+import base64
+import hashlib
+import os
+import random
+import time
+from datetime import datetime, timezone
+
+import libipld
+
+from atproto import AsyncClient, SessionEvent, models
+from atproto.exceptions import (
+    NetworkError,
+    RequestException,
+    UnauthorizedError,
+)
+
+# Retry budget for transient Bluesky errors
+BLUESKY_MAX_RETRIES = int(os.getenv("BLUESKY_MAX_RETRIES", "4"))
+BLUESKY_BACKOFF_BASE = 1.0
+BLUESKY_BACKOFF_MAX = 30.0
+# Never sleep longer than this waiting for a rate limit window to reset
+BLUESKY_MAX_RATE_LIMIT_WAIT = 120.0
+
+POST_COLLECTION = "app.bsky.feed.post"
+TID_ALPHABET = "234567abcdefghijklmnopqrstuvwxyz"
+_last_tid_timestamp = 0
+
+
+def next_tid():
+    """Generate a record key (TID): microseconds since epoch plus a clock id"""
+    global _last_tid_timestamp
+    # Strictly increasing, so keys in one thread sort in posting order
+    timestamp = max(time.time_ns() // 1000, _last_tid_timestamp + 1)
+    _last_tid_timestamp = timestamp
+    value = (timestamp << 10) | random.getrandbits(10)
+    return "".join(
+        TID_ALPHABET[(value >> shift) & 31] for shift in range(60, -1, -5)
+    )
+
+
+def record_cid(record):
+    """CIDv1 (dag-cbor, sha2-256) of a record, as the PDS will compute it"""
+    digest = hashlib.sha256(libipld.encode_dag_cbor(record)).digest()
+    cid = bytes([0x01, 0x71, 0x12, len(digest)]) + digest
+    return "b" + base64.b32encode(cid).decode().lower().rstrip("=")
+
+
+class _RateLimitAwareClient(AsyncClient):
+    """AsyncClient that remembers the last ratelimit-* headers it saw"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.rate_limit_remaining = None
+        self.rate_limit_reset = None
+
+    def update_rate_limit(self, headers):
+        headers = {k.lower(): v for k, v in (headers or {}).items()}
+        if "ratelimit-remaining" in headers:
+            self.rate_limit_remaining = int(headers["ratelimit-remaining"])
+        if "ratelimit-reset" in headers:
+            self.rate_limit_reset = float(headers["ratelimit-reset"])
+
+    async def _invoke(self, invoke_type, **kwargs):
+        response = await super()._invoke(invoke_type, **kwargs)
+        self.update_rate_limit(response.headers)
+        return response
+
+
+class BlueskyPublisher:
+    """Posts to Bluesky without blocking the event loop.
+
+    One logged-in AsyncClient is shared by every post. atproto refreshes the
+    access token on its own; if the session is rejected anyway we log in again.
+    Transient failures are retried with exponential backoff and the
+    ratelimit-* headers Bluesky sends are honoured before each write.
+    """
+
+    def __init__(self, handle, password, session_path=None, base_url=None):
+        self.handle = handle
+        self.password = password
+        self.session_path = session_path
+        # base_url points at a PDS's /xrpc root, defaults to bsky.social
+        self.client = _RateLimitAwareClient(base_url=base_url)
+        self.client.on_session_change(self._on_session_change)
+        self.profile = None
+        self._login_lock = asyncio.Lock()
+
+    async def _on_session_change(self, event, session):
+        """Persist the session so restarts don't need a fresh login"""
+        if not self.session_path:
+            return
+        if event in (SessionEvent.CREATE, SessionEvent.REFRESH):
+            with open(self.session_path, "w") as f:
+                f.write(session.export())
+
+    async def login(self, force=False):
+        """Log in once, reusing a saved session when there is one"""
+        async with self._login_lock:
+            if self.profile is not None and not force:
+                return self.profile
+            saved = self.session_path and os.path.exists(self.session_path)
+            if saved and not force:
+                with open(self.session_path) as f:
+                    session_string = f.read().strip()
+                try:
+                    self.profile = await self.client.login(
+                        session_string=session_string
+                    )
+                    return self.profile
+                except Exception as e:
+                    print(f"Saved Bluesky session rejected, logging in again: {e}")
+            self.profile = await self.client.login(self.handle, self.password)
+            return self.profile
+
+    async def _wait_for_rate_limit(self):
+        """Sleep until the rate limit window resets if it is exhausted"""
+        if self.client.rate_limit_remaining == 0 and self.client.rate_limit_reset:
+            delay = self.client.rate_limit_reset - time.time()
+            if delay > 0:
+                await asyncio.sleep(min(delay, BLUESKY_MAX_RATE_LIMIT_WAIT))
+
+    def _retry_delay(self, error, attempt):
+        """Seconds to wait before retrying, or None if error isn't transient"""
+        status = None if error.response is None else error.response.status_code
+        if status == 429:
+            headers = {k.lower(): v for k, v in error.response.headers.items()}
+            if "ratelimit-reset" in headers:
+                reset_in = float(headers["ratelimit-reset"]) - time.time()
+                return min(max(reset_in, 0.0), BLUESKY_MAX_RATE_LIMIT_WAIT)
+        elif status is not None and status < 500:
+            return None
+        backoff = min(BLUESKY_BACKOFF_BASE * 2**attempt, BLUESKY_BACKOFF_MAX)
+        return backoff * random.uniform(0.5, 1.0)
+
+    async def _call(self, method, *args, **kwargs):
+        """Invoke a client method with login, rate limit and retry handling"""
+        await self.login()
+        relogged = False
+        attempt = 0
+        while True:
+            await self._wait_for_rate_limit()
+            try:
+                return await method(*args, **kwargs)
+            except UnauthorizedError:
+                if relogged:
+                    raise
+                relogged = True
+                await self.login(force=True)
+            except (NetworkError, RequestException) as e:
+                if e.response is not None:
+                    self.client.update_rate_limit(e.response.headers)
+                delay = self._retry_delay(e, attempt)
+                if delay is None or attempt >= BLUESKY_MAX_RETRIES:
+                    raise
+                attempt += 1
+                print(f"Bluesky request failed, retrying in {delay:.1f}s: {e}")
+                await asyncio.sleep(delay)
+
+    def _plan_thread(self, chunks):
+        """Pick the timestamp and record keys a thread will be posted under"""
+        return {
+            "created_at": datetime.now(timezone.utc).isoformat(),
+            "rkeys": [next_tid() for _ in chunks],
+        }
+
+    def _build_thread(self, chunks, plan):
+        """Build every post record of a planned thread locally, with reply refs
+
+        The records only depend on the chunks and the plan, so a restarted
+        process rebuilds exactly the same records, rkeys and CIDs.
+        """
+        did = self.client.me.did
+        writes = []
+        refs = []
+        for chunk, rkey in zip(chunks, plan["rkeys"]):
+            reply = None
+            if refs:
+                reply = models.AppBskyFeedPost.ReplyRef(root=refs[0], parent=refs[-1])
+            record = models.AppBskyFeedPost.Record(
+                text=chunk, created_at=plan["created_at"], langs=["en"], reply=reply
+            )
+            writes.append(
+                models.ComAtprotoRepoApplyWrites.Create(
+                    collection=POST_COLLECTION, rkey=rkey, value=record
+                )
+            )
+            refs.append(
+                models.ComAtprotoRepoStrongRef.Main(
+                    uri=f"at://{did}/{POST_COLLECTION}/{rkey}",
+                    # Hash exactly what the SDK will send for this record
+                    cid=record_cid(models.get_model_as_dict(record)),
+                )
+            )
+        return writes, refs
+
+    async def _existing_ref(self, rkey):
+        """Strong ref to our post under rkey, or None if there is none"""
+        try:
+            response = await self.client.com.atproto.repo.get_record(
+                {
+                    "repo": self.client.me.did,
+                    "collection": POST_COLLECTION,
+                    "rkey": rkey,
+                }
+            )
+        except Exception:
+            return None
+        return models.ComAtprotoRepoStrongRef.Main(uri=response.uri, cid=response.cid)
+
+    async def send_thread(self, chunks, checkpoint=None, on_checkpoint=None):
+        """Post chunks as a thread and return the created post references
+
+        The whole thread goes out in one applyWrites call with records, CIDs
+        and reply refs computed up front. If the batch is rejected we fall
+        back to posting one chunk at a time.
+
+        checkpoint is the thread state saved by an earlier attempt, if any.
+        on_checkpoint(state) is called with JSON-serializable state before
+        anything is written and after every post, so a process that dies
+        halfway can finish the same thread instead of posting it twice.
+        """
+        await self.login()
+
+        def save(state):
+            if on_checkpoint is not None:
+                on_checkpoint(state)
+
+        if checkpoint and checkpoint.get("posts"):
+            # We were already posting chunk by chunk, carry on with that
+            return await self._send_thread_sequentially(chunks, checkpoint, save)
+
+        resuming = bool(checkpoint)
+        plan = checkpoint or self._plan_thread(chunks)
+        if not resuming:
+            save(plan)
+        writes, refs = self._build_thread(chunks, plan)
+        # applyWrites is atomic, if the first post exists the whole thread does
+        if resuming and await self._existing_ref(writes[0].rkey) is not None:
+            return refs
+        try:
+            response = await self._call(
+                self.client.com.atproto.repo.apply_writes,
+                models.ComAtprotoRepoApplyWrites.Data(
+                    repo=self.client.me.did, writes=writes
+                ),
+            )
+            # Older PDS versions don't return per-write results
+            for result, ref in zip(response.results or [], refs):
+                if result.cid != ref.cid:
+                    print(f"Local CID {ref.cid} differs from PDS CID {result.cid}")
+            return refs
+        except Exception as e:
+            # Explicit rkeys make the batch idempotent, so if it did land
+            # despite the error we must not post the thread again
+            if await self._existing_ref(writes[0].rkey) is not None:
+                return refs
+            print(f"Batched thread post failed, posting sequentially: {e}")
+        return await self._send_thread_sequentially(chunks, plan, save)
+
+    async def _send_thread_sequentially(self, chunks, plan, save):
+        """Post chunks one by one under their planned rkeys, each replying to
+        the previous one, skipping posts an earlier attempt already made"""
+        did = self.client.me.did
+        refs = [
+            models.ComAtprotoRepoStrongRef.Main(uri=post["uri"], cid=post["cid"])
+            for post in plan.get("posts", [])
+        ]
+        for i in range(len(refs), len(chunks)):
+            rkey = plan["rkeys"][i]
+            # Only the first unsaved post can have landed before a crash
+            ref = None
+            if i == len(plan.get("posts", [])):
+                ref = await self._existing_ref(rkey)
+            if ref is None:
+                reply = None
+                if refs:
+                    reply = models.AppBskyFeedPost.ReplyRef(
+                        root=refs[0], parent=refs[-1]
+                    )
+                record = models.AppBskyFeedPost.Record(
+                    text=chunks[i],
+                    created_at=plan["created_at"],
+                    langs=["en"],
+                    reply=reply,
+                )
+                response = await self._call(
+                    self.client.com.atproto.repo.create_record,
+                    models.ComAtprotoRepoCreateRecord.Data(
+                        repo=did, collection=POST_COLLECTION, rkey=rkey, record=record
+                    ),
+                )
+                ref = models.ComAtprotoRepoStrongRef.Main(
+                    uri=response.uri, cid=response.cid
+                )
+            refs.append(ref)
+            plan = {**plan, "posts": [{"uri": r.uri, "cid": r.cid} for r in refs]}
+            save(plan)
+        return refs
+
+    def post_url(self, post):
+        """Public bsky.app URL of a created post"""
+        rkey = post.uri.split("/")[-1]
+        return f"https://bsky.app/profile/{self.handle}/post/{rkey}"
@@ -0,0 +1,119 @@
+import re
+import shelve
+import threading
+import time
+from collections import OrderedDict
+
+# Seconds a tool result stays fresh. Social media moves faster than the web.
+TOOL_CACHE_TTLS = {
+    "perplexity_web_search": 30 * 60,
+    "grok_x_search": 5 * 60,
+    "openbb_news_search": 10 * 60,
+    "openbb_news_on_company_search": 10 * 60,
+}
+
+
+def normalize_query(query):
+    """Normalize a query so trivially different spellings share a cache key"""
+    query = re.sub(r"[^\w$.&-]+", " ", str(query).lower())
+    return " ".join(query.split())
+
+
+class ToolCache:
+    """Bounded LRU cache of tool results with per-tool TTLs.
+
+    If a path is given, entries are written through to a shelve file and
+    reloaded on startup so the cache survives restarts.
+    """
+
+    def __init__(self, ttls=None, default_ttl=15 * 60, max_entries=256, path=None):
+        self.ttls = {**TOOL_CACHE_TTLS, **(ttls or {})}
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._shelf = None
+        if path:
+            self._shelf = shelve.open(path)
+            self._load()
+
+    def _load(self):
+        """Restore unexpired entries from disk, oldest first"""
+        now = time.time()
+        entries = []
+        for key in list(self._shelf.keys()):
+            try:
+                expires_at, stored_at, value = self._shelf[key]
+            except Exception:
+                del self._shelf[key]
+                continue
+            if expires_at <= now:
+                del self._shelf[key]
+            else:
+                entries.append((stored_at, key, expires_at, value))
+        for stored_at, key, expires_at, value in sorted(entries, key=lambda e: e[0]):
+            self._entries[key] = (expires_at, stored_at, value)
+        self._evict()
+
+    def _key(self, func_name, params):
+        query = normalize_query(params.get("query", ""))
+        return f"{func_name}:{query}"
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            key, _ = self._entries.popitem(last=False)
+            if self._shelf is not None:
+                self._shelf.pop(key, None)
+
+    def get(self, func_name, params):
+        """Return the cached result, or None on a miss or expired entry"""
+        key = self._key(func_name, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] <= time.time():
+                if entry is not None:
+                    del self._entries[key]
+                    if self._shelf is not None:
+                        self._shelf.pop(key, None)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[2]
+
+    def set(self, func_name, params, value):
+        """Store a tool result under its tool's TTL"""
+        if value is None:
+            return
+        key = self._key(func_name, params)
+        now = time.time()
+        entry = (now + self.ttls.get(func_name, self.default_ttl), now, value)
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            if self._shelf is not None:
+                try:
+                    self._shelf[key] = entry
+                except Exception as e:
+                    print(f"Error persisting cache entry {key}: {e}")
+            self._evict()
+
+    def stats(self):
+        """Return hit/miss counters and the current size"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "size": len(self._entries),
+            }
+
+    def close(self):
+        """Flush and close the on-disk store"""
+        with self._lock:
+            if self._shelf is not None:
+                self._shelf.close()
+                self._shelf = None
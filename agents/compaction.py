@@ -0,0 +1,156 @@
+import html
+import math
+import os
+import re
+
+# Approximate token budget for all research context in the post prompt,
+# 0 passes tool results through verbatim
+RESEARCH_TOKEN_BUDGET = int(os.getenv("RESEARCH_TOKEN_BUDGET", "400"))
+# Sentences kept per article body before the budget decides
+MAX_SENTENCES_PER_ARTICLE = 2
+MAX_SENTENCE_CHARS = 240
+
+STOPWORDS = {
+    "the", "and", "for", "with", "about", "what", "how", "why", "are", "is",
+    "on", "of", "in", "to", "a", "an", "this", "that", "latest", "news",
+}
+
+_TAGS = re.compile(r"<[^>]+>")
+_CITATIONS = re.compile(r"\s*\[\d+\]")
+_MARKDOWN = re.compile(r"[*_`#>]+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def estimate_tokens(text):
+    """Rough token count, Llama tokenizers average about 4 chars per token"""
+    return math.ceil(len(text) / 4)
+
+
+def _clean(text):
+    text = html.unescape(_TAGS.sub(" ", str(text)))
+    text = _CITATIONS.sub("", _MARKDOWN.sub("", text))
+    return " ".join(text.split())
+
+
+def _keywords(topic):
+    words = re.findall(r"[a-z0-9$]+", topic.lower())
+    return {w.lstrip("$") for w in words if len(w) > 2 and w not in STOPWORDS}
+
+
+def _shorten(sentence):
+    if len(sentence) <= MAX_SENTENCE_CHARS:
+        return sentence
+    return sentence[:MAX_SENTENCE_CHARS].rsplit(" ", 1)[0] + "..."
+
+
+def key_sentences(text, keywords, limit=None):
+    """Return (position, sentence) pairs, most informative first
+
+    Sentences score for sharing words with the topic and for carrying numbers
+    (prices, percentages, dates). Earlier sentences win ties. Fragments of
+    20 chars or less are dropped, unless the text has nothing longer.
+    """
+    sentences = []
+    for sentence in _SENTENCE_END.split(_clean(text)):
+        if sentence and sentence not in sentences:
+            sentences.append(sentence)
+    if any(len(s) > 20 for s in sentences):
+        sentences = [s for s in sentences if len(s) > 20]
+
+    def score(item):
+        position, sentence = item
+        words = set(re.findall(r"[a-z0-9]+", sentence.lower()))
+        return (
+            2 * len(words & keywords)
+            + bool(re.search(r"\d", sentence))
+            - position / (len(sentences) + 1)
+        )
+
+    ranked = sorted(enumerate(sentences), key=score, reverse=True)
+    return [(position, _shorten(s)) for position, s in ranked[:limit]]
+
+
+def _articles(result):
+    """Return a list of dicts if result looks like a list of news articles"""
+    items = getattr(result, "results", result)
+    if not isinstance(items, (list, tuple)):
+        return None
+    articles = []
+    for item in items:
+        if hasattr(item, "model_dump"):
+            item = item.model_dump()
+        if not isinstance(item, dict) or "title" not in item:
+            return None
+        articles.append(item)
+    return articles
+
+
+def _article_units(articles, keywords):
+    """Headlines first, then each article's key sentences in rank order"""
+    units = []
+    for i, article in enumerate(articles):
+        date = str(article.get("date") or "")[:10]
+        title = _clean(article["title"])
+        units.append(((i, -1), f"- {date}: {title}" if date else f"- {title}"))
+    for rank in range(MAX_SENTENCES_PER_ARTICLE):
+        for i, article in enumerate(articles):
+            body = article.get("text") or article.get("body") or ""
+            sentences = key_sentences(body, keywords, MAX_SENTENCES_PER_ARTICLE)
+            if rank < len(sentences):
+                position, sentence = sentences[rank]
+                units.append(((i, position), f"  {sentence}"))
+    return units
+
+
+def _text_units(text, keywords):
+    sentences = key_sentences(text, keywords)
+    return [((position,), sentence) for position, sentence in sentences]
+
+
+def compact_research(results, topic, budget=RESEARCH_TOKEN_BUDGET):
+    """Fit tool results into about budget tokens of post prompt context
+
+    results is a list of (tool name, raw result). News results keep dated
+    headlines and their key sentences, free text keeps its key sentences.
+    Tools take turns adding their next most important line so one long
+    answer can't crowd out the others. Results already within budget are
+    kept verbatim. Returns (context, raw tokens, compacted tokens).
+    """
+    raw = "\n\n".join(f"[{name}]\n{result}" for name, result in results)
+    if not budget or estimate_tokens(raw) <= budget:
+        # Nothing to save, keep the results whole
+        return raw, estimate_tokens(raw), estimate_tokens(raw)
+
+    keywords = _keywords(topic)
+    queues = []
+    for name, result in results:
+        articles = _articles(result)
+        if articles is not None:
+            units = _article_units(articles, keywords)
+        else:
+            units = _text_units(result, keywords)
+        queues.append((name, units))
+
+    used = sum(estimate_tokens(f"[{name}]\n") for name, _ in queues)
+    # Per result rather than per name, a tool can answer more than once
+    kept = [[] for _ in queues]
+    # Syndicated articles and overlapping tools often repeat the same sentence
+    seen = set()
+    while any(units for _, units in queues):
+        for (_, units), lines in zip(queues, kept):
+            if not units:
+                continue
+            order, line = units.pop(0)
+            cost = estimate_tokens(line + "\n")
+            if line.strip() not in seen and used + cost <= budget:
+                lines.append((order, line))
+                seen.add(line.strip())
+                used += cost
+
+    sections = [
+        f"[{name}]\n" + "\n".join(line for _, line in sorted(lines))
+        for (name, _), lines in zip(queues, kept)
+        if lines
+    ]
+    context = "\n\n".join(sections)
+    return context, estimate_tokens(raw), estimate_tokens(context)
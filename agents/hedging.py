@@ -0,0 +1,136 @@
+import asyncio
+import os
+from collections import deque
+
+from .metrics import HEDGE_WINS, HEDGES
+
+HEDGE_ENABLED = os.getenv("HEDGE_TOOLS", "true").lower() in ("1", "true", "yes")
+# A tool call still running at this percentile of its recent latencies gets a
+# backup request
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+# Seconds to wait before hedging a tool with too few samples for a percentile
+HEDGE_INITIAL_DELAY = float(os.getenv("HEDGE_INITIAL_DELAY", "5"))
+HEDGE_MIN_SAMPLES = 20
+LATENCY_WINDOW = 200
+
+# Providers that answer the same kind of query, used as the backup request.
+# Tools not listed are hedged with a duplicate request to the same tool.
+HEDGE_ALTERNATIVES = {
+    "openbb_news_search": "perplexity_web_search",
+    "openbb_news_on_company_search": "perplexity_web_search",
+    "perplexity_web_search": "openbb_news_search",
+}
+
+
+class LatencyTracker:
+    """Sliding window of recent latencies per tool, for online percentiles."""
+
+    def __init__(self, window=LATENCY_WINDOW, min_samples=HEDGE_MIN_SAMPLES):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples = {}
+
+    def observe(self, tool, seconds):
+        samples = self._samples.setdefault(tool, deque(maxlen=self.window))
+        samples.append(seconds)
+
+    @staticmethod
+    def _percentile(samples, q):
+        samples = sorted(samples)
+        return samples[min(len(samples) - 1, int(len(samples) * q))]
+
+    def percentile(self, tool, q):
+        """Return the q-th latency percentile, None until min_samples are in"""
+        samples = self._samples.get(tool, ())
+        if len(samples) < self.min_samples:
+            return None
+        return self._percentile(samples, q)
+
+    def stats(self):
+        return {
+            tool: {
+                "samples": len(samples),
+                "p50_ms": 1000 * self._percentile(samples, 0.5),
+                "p95_ms": 1000 * self._percentile(samples, 0.95),
+            }
+            for tool, samples in self._samples.items()
+        }
+
+
+class Hedger:
+    """Races a slow or failed tool call against a backup request.
+
+    The primary call gets until its tool's HEDGE_PERCENTILE latency. If it
+    hasn't answered by then, or fails before that, the backup (an equivalent
+    provider or a duplicate) is started. The first useful result wins and
+    the other request is cancelled.
+    """
+
+    def __init__(
+        self,
+        latency=None,
+        percentile=HEDGE_PERCENTILE,
+        initial_delay=HEDGE_INITIAL_DELAY,
+        alternatives=None,
+        enabled=HEDGE_ENABLED,
+    ):
+        # Fed by the caller with the latency of every uncached tool call
+        self.latency = latency or LatencyTracker()
+        self.percentile = percentile
+        self.initial_delay = initial_delay
+        self.alternatives = HEDGE_ALTERNATIVES if alternatives is None else alternatives
+        self.enabled = enabled
+        self.counts = {"calls": 0, "hedged": 0, "backup_wins": 0}
+
+    def delay(self, tool):
+        """Seconds to give tool before sending the backup request"""
+        observed = self.latency.percentile(tool, self.percentile)
+        return self.initial_delay if observed is None else observed
+
+    async def run(self, tool, params, execute):
+        """Return (tool that answered, result) of awaiting execute(tool, params)
+
+        execute returns None when a call fails. The result is None only if
+        both the primary and the backup failed. execute also gets primary,
+        False for the backup request, which is cancelled early when it loses
+        and so says little about the tool's latency.
+        """
+        self.counts["calls"] += 1
+        if not self.enabled:
+            return tool, await execute(tool, params, primary=True)
+
+        primary = asyncio.create_task(execute(tool, params, primary=True))
+        racers = {primary: tool}
+        hedged = False
+        try:
+            while racers:
+                done, _ = await asyncio.wait(
+                    racers,
+                    timeout=None if hedged else self.delay(tool),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    name = racers.pop(task)
+                    if task.result():
+                        if hedged:
+                            winner = "primary" if task is primary else "backup"
+                            self.counts["backup_wins"] += winner == "backup"
+                            HEDGE_WINS.inc(tool=tool, winner=winner)
+                        return name, task.result()
+                if not hedged:
+                    hedged = True
+                    backup = self.alternatives.get(tool, tool)
+                    self.counts["hedged"] += 1
+                    HEDGES.inc(
+                        tool=tool, backup=backup, reason="error" if done else "slow"
+                    )
+                    racers[asyncio.create_task(execute(backup, params, primary=False))] = backup
+            return tool, None
+        finally:
+            # The losing request is aborted, or abandoned if it runs in a thread
+            for task in racers:
+                task.cancel()
+
+    def stats(self):
+        """Hedge counts and the per-tool latencies driving the thresholds"""
+        return {**self.counts, "latency": self.latency.stats()}
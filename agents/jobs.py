@@ -0,0 +1,128 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+JOB_STORE_PATH = os.getenv("JOB_STORE_PATH", "jobs.sqlite3")
+# Interrupted jobs older than this are not resumed after a restart
+JOB_RESUME_MAX_AGE = float(os.getenv("JOB_RESUME_MAX_AGE", "86400"))
+# Finished jobs are deleted this many seconds after their last update, long
+# after Telegram stops redelivering them
+JOB_RETENTION = float(os.getenv("JOB_RETENTION", str(7 * 86400)))
+# Seconds between pruning passes
+PRUNE_INTERVAL = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    update_id INTEGER PRIMARY KEY,
+    user_id INTEGER,
+    username TEXT,
+    chat_id INTEGER,
+    prompt TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    stage TEXT NOT NULL DEFAULT 'received',
+    data TEXT NOT NULL DEFAULT '{}',
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+)
+"""
+
+
+class JobStore:
+    """SQLite record of every Telegram update and how far its pipeline got.
+
+    Jobs are keyed by update_id. Each completed stage merges its output into
+    the job's JSON data (routing decision, research, generated text, thread
+    state), so a redelivered update or a restarted process can pick up after
+    the last completed stage instead of starting over.
+    """
+
+    def __init__(self, path=JOB_STORE_PATH, retention=JOB_RETENTION):
+        self.path = path
+        self.retention = retention
+        self._pruned_at = 0.0
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._db:
+            if path != ":memory:":
+                self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(SCHEMA)
+
+    @staticmethod
+    def _job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job["data"] = json.loads(job["data"])
+        return job
+
+    def get(self, update_id):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM jobs WHERE update_id = ?", (update_id,)
+            ).fetchone()
+        return self._job(row)
+
+    def create(self, update_id, user_id, username, chat_id, prompt):
+        """Return (job, created), created is False for a job seen before"""
+        now = time.time()
+        if now - self._pruned_at > PRUNE_INTERVAL:
+            self.prune()
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "INSERT OR IGNORE INTO jobs (update_id, user_id, username, chat_id,"
+                " prompt, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (update_id, user_id, username, chat_id, prompt, now, now),
+            )
+        return self.get(update_id), cursor.rowcount == 1
+
+    def checkpoint(self, update_id, stage, data):
+        """Record that stage completed, merging data into the job's data"""
+        with self._lock, self._db:
+            row = self._db.execute(
+                "SELECT data FROM jobs WHERE update_id = ?", (update_id,)
+            ).fetchone()
+            merged = {**json.loads(row["data"]), **data}
+            self._db.execute(
+                "UPDATE jobs SET stage = ?, data = ?, updated_at = ?"
+                " WHERE update_id = ?",
+                (stage, json.dumps(merged), time.time(), update_id),
+            )
+
+    def finish(self, update_id, status, error=None):
+        """Mark a job done or failed"""
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE jobs SET status = ?, error = ?, updated_at = ?"
+                " WHERE update_id = ?",
+                (status, error, time.time(), update_id),
+            )
+
+    def prune(self, max_age=None):
+        """Delete finished jobs older than max_age (the retention by default)"""
+        now = time.time()
+        max_age = self.retention if max_age is None else max_age
+        with self._lock, self._db:
+            cursor = self._db.execute(
+                "DELETE FROM jobs WHERE status != 'pending' AND updated_at < ?",
+                (now - max_age,),
+            )
+        self._pruned_at = now
+        return cursor.rowcount
+
+    def unfinished(self, max_age=JOB_RESUME_MAX_AGE):
+        """Jobs still pending, i.e. interrupted by a restart, oldest first"""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT * FROM jobs WHERE status = 'pending' AND updated_at > ?"
+                " ORDER BY update_id",
+                (time.time() - max_age,),
+            ).fetchall()
+        return [self._job(row) for row in rows]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
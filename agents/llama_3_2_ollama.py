@@ -1,7 +1,31 @@
-import requests
-from .tools.perplexity import perplexity_web_search
-from .tools.grok import grok_x_search
-from .tools.openbb import openbb_news_search, openbb_news_on_company_search
+import asyncio
+import json
+import os
+import re
+import time
+
+from .backends import create_backend
+from .cache import ToolCache
+from .compaction import RESEARCH_TOKEN_BUDGET, compact_research
+from .hedging import Hedger
+from .metrics import (
+    RESEARCH_TOKENS,
+    ROUTES,
+    ROUTING_BATCH_SIZE,
+    SPECULATION_SECONDS,
+    SPECULATIONS,
+    TIMEOUTS,
+    TOOL_CALLS,
+    TOOL_SECONDS,
+    record_ollama_response,
+    stage_span,
+    track_cancellation,
+)
+from .microbatch import MicroBatcher
+from .news_index import NEWS_INDEX
+from .router import ROUTER_CONFIDENCE_THRESHOLD, RuleRouter
+from .semantic_cache import EMBEDDING_MODEL, SEMANTIC_CACHE_ENABLED, SemanticCache
+from .tools.registry import ToolRegistry
 
 FUNCTION_DEFINITIONS = [
     {
@@ -63,58 +87,36 @@ FUNCTION_DEFINITIONS = [
             "properties": {
                 "query": {
                     "type": "str",
-                    "description": "The company name to search for news articles"
+                    "description": "Ticker symbols of the companies, comma separated (e.g. NVDA,AAPL)"
                 },
             }
         }
     }
 ]
 
-class LanguageModelWrapper:
-
-    def _parse_function_call(self, response_text):
-        """Parse a function call from the model's response"""
-        try:
-            # Extract function name and parameters
-            func_name = response_text.split('(')[0].strip()
-            # Extract everything between parentheses
-            params_str = response_text[response_text.find('(')+1:response_text.rfind(')')]
-            # Parse parameters
-            params = {}
-            if 'query="' in params_str:  # Handle quoted string parameters
-                params['query'] = params_str.split('query="')[1].split('"')[0]
-            return func_name, params
-        except Exception as e:
-            print(f"Error parsing function call: {e}")
-            return None, None
-
-    def _execute_function(self, func_name, params):
-        """Execute the specified function with given parameters"""
-        function_mapping = {
-            'perplexity_web_search': perplexity_web_search,
-            'grok_x_search': grok_x_search,
-            'openbb_news_search': openbb_news_search,
-            'openbb_news_on_company_search': openbb_news_on_company_search,
-            # Add new functions here as they become available
-            # 'another_function': another_function,
-        }
-        
-        if func_name in function_mapping:
-            try:
-                return function_mapping[func_name](**params)
-            except Exception as e:
-                print(f"Error executing function {func_name}: {e}")
-                return None
-        return None
+DEFAULT_MODEL = "llama3.2:latest"
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "4"))
+# How long Ollama keeps the model loaded after a request ("30m", "-1" = forever)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+TOOL_CACHE_PATH = os.getenv("TOOL_CACHE_PATH")
 
+# Seconds each research tool gets before its result is dropped, and the
+# overall budget for the whole parallel research step
+TOOL_DEADLINES = {
+    "perplexity_web_search": 15.0,
+    "grok_x_search": 15.0,
+    "openbb_news_search": 8.0,
+    "openbb_news_on_company_search": 8.0,
+}
+DEFAULT_TOOL_DEADLINE = 10.0
+RESEARCH_BUDGET = float(os.getenv("RESEARCH_BUDGET", "15"))
+MAX_PARALLEL_TOOLS = 3
 
-    def generate_response(self, prompt, model="llama3.2:latest"):
-        """Send request to local Ollama instance"""
-        try:
-            # First step: Research prompt
-            research_prompt = f"""You are a research assistant.
+# Static prompt prefixes. They go first in every prompt so the tokens Ollama
+# already evaluated for the previous request can be reused from its KV cache.
+RESEARCH_PROMPT_PREFIX = f"""You are a research assistant.
             Based on the following topic, determine if you need to gather additional information.
-            If you do, you can use one of these available functions:
+            If you do, you can use one or more of these available functions:
 
             {str(FUNCTION_DEFINITIONS)}
 
@@ -135,43 +137,96 @@ class LanguageModelWrapper:
             - Twitter/X specific content
             - Real-time reactions and trends
 
-            Format your response exactly like this if you want to call a function:
-            FUNCTION: function_name(param_name="param_value")
+            Respond with JSON only, listing the function calls you want to make:
+            {{"calls": [{{"name": "function_name", "arguments": {{"query": "..."}}}}]}}
 
             If you don't need to gather information, respond with:
-            NO_FUNCTION_NEEDED
-
-            Topic: {prompt}
+            {{"calls": []}}
 
-            Note: You can only call one function at a time.
+            Note: You can call up to {MAX_PARALLEL_TOOLS} functions, they run in parallel.
             """
 
-            # Get function call decision
-            response = requests.post(
-                "http://localhost:11434/api/generate",
-                json={"model": model, "prompt": research_prompt, "stream": False},
-            )
-            function_response = response.json()["response"].strip()
-            
-            research_results = ""
-            func_name = None
-
-            # Check if a single function call is needed
-            if function_response.startswith("FUNCTION:"):
-                function_call = function_response.replace("FUNCTION:", "").strip()
-                func_name, params = self._parse_function_call(function_call)
-                
-                if func_name and params:
-                    research_results = self._execute_function(func_name, params)
-                else:
-                    print("Failed to parse function call")
-                    research_results = ""
-            else:
-                research_results = ""
+# FUNCTION_DEFINITIONS use Python type names, JSON schema wants its own
+JSON_SCHEMA_TYPES = {
+    "str": "string",
+    "int": "integer",
+    "float": "number",
+    "bool": "boolean",
+    "dict": "object",
+    "list": "array",
+}
+
 
+def build_routing_schema(function_definitions, max_calls):
+    """JSON schema for {"calls": [{"name", "arguments"}]} from function definitions
 
-            # Second step: Tweet generation
-            post_prompt = """You are Didier Rodrigues Lopes, founder and CEO of OpenBB.
+    Passed to Ollama as the format, so the router can only emit known
+    functions with their required arguments.
+    """
+    calls = []
+    for definition in function_definitions:
+        parameters = definition["parameters"]
+        calls.append(
+            {
+                "type": "object",
+                "properties": {
+                    "name": {"const": definition["name"]},
+                    "arguments": {
+                        "type": "object",
+                        "properties": {
+                            name: {
+                                "type": JSON_SCHEMA_TYPES.get(spec["type"], "string"),
+                                "description": spec["description"],
+                            }
+                            for name, spec in parameters["properties"].items()
+                        },
+                        "required": parameters["required"],
+                    },
+                },
+                "required": ["name", "arguments"],
+            }
+        )
+    return {
+        "type": "object",
+        "properties": {
+            "calls": {
+                "type": "array",
+                "items": {"anyOf": calls},
+                "maxItems": max_calls,
+            }
+        },
+        "required": ["calls"],
+    }
+
+
+ROUTING_SCHEMA = build_routing_schema(FUNCTION_DEFINITIONS, MAX_PARALLEL_TOOLS)
+# A call is ~30 tokens of JSON, enough for MAX_PARALLEL_TOOLS of them
+ROUTER_MAX_TOKENS = int(os.getenv("ROUTER_MAX_TOKENS", "120"))
+# Prompts reaching the LLM router within ROUTER_BATCH_WINDOW seconds of each
+# other share one routing call, up to ROUTER_BATCH_SIZE of them. 1 disables it.
+# The window shrinks with the number of other prompts still being routed, so a
+# lone prompt (e.g. MAX_CONCURRENT_GENERATIONS=1) never waits for company
+ROUTER_BATCH_WINDOW = float(os.getenv("ROUTER_BATCH_WINDOW", "0.02"))
+ROUTER_BATCH_SIZE = int(os.getenv("ROUTER_BATCH_SIZE", "8"))
+
+
+def build_batch_routing_schema(routing_schema, count):
+    """JSON schema for {"routes": [...]} holding count routing decisions"""
+    return {
+        "type": "object",
+        "properties": {
+            "routes": {
+                "type": "array",
+                "items": routing_schema,
+                "minItems": count,
+                "maxItems": count,
+            }
+        },
+        "required": ["routes"],
+    }
+
+
+POST_PROMPT_PREFIX = """You are Didier Rodrigues Lopes, founder and CEO of OpenBB.
             Write banger tweets that reflect my voice and expertise in open source, AI, and finance.
 
             Tweet Style Guide:
@@ -191,21 +246,792 @@ class LanguageModelWrapper:
             - Single clear statement or insight
             """
 
-            # Add research results if available
-            if research_results:
-                post_prompt += f"\nHere is additional context that you can use to write such post:\n{research_results}"
-            
-            post_prompt += f"\nTopic: {prompt}\n\nRespond with ONLY the tweet text, nothing else."
 
-            response = requests.post(
-                "http://localhost:11434/api/generate",
-                json={"model": model, "prompt": post_prompt, "stream": False},
-            ) 
-            return {
-                "text": response.json()["response"].strip(),
-                "tool_used": func_name if func_name else "",
+# Bluesky's post length, used to cut streamed generations short
+POST_CHAR_BUDGET = 300
+
+# Draft a no-context post while the LLM router decides, kept if it picks no tools
+SPECULATIVE_POSTS = os.getenv("SPECULATIVE_POSTS", "").lower() in ("1", "true", "yes")
+
+
+class LanguageModelWrapper:
+    def __init__(
+        self,
+        backend=None,
+        max_connections=OLLAMA_MAX_CONNECTIONS,
+        keepalive_timeout=60.0,
+        request_timeout=120.0,
+        tool_cache=None,
+        keep_alive=OLLAMA_KEEP_ALIVE,
+        router=None,
+        router_threshold=ROUTER_CONFIDENCE_THRESHOLD,
+        research_token_budget=RESEARCH_TOKEN_BUDGET,
+        speculative=SPECULATIVE_POSTS,
+        semantic_cache=None,
+        hedger=None,
+        router_batch_size=ROUTER_BATCH_SIZE,
+        router_batch_window=ROUTER_BATCH_WINDOW,
+    ):
+        # Any agents.backends.Backend, by default the Ollama host(s) in
+        # OLLAMA_URLS with requests balanced across them
+        self.backend = backend or create_backend(
+            max_connections=max_connections,
+            keepalive_timeout=keepalive_timeout,
+            request_timeout=request_timeout,
+        )
+        self.tool_cache = tool_cache or ToolCache(path=TOOL_CACHE_PATH)
+        # Tools are imported and authenticated on first use or in warm_up_tools
+        self.tools = ToolRegistry()
+        # Backup requests for tool calls slower than their recent p95
+        self.hedger = hedger or Hedger()
+        # Fast local router tried before the LLM one, None disables it. It
+        # also trusts the tickers seen in ingested news
+        self.router = (
+            router
+            if router is not None
+            else RuleRouter(extra_tickers=NEWS_INDEX.symbols)
+        )
+        self.router_threshold = router_threshold
+        # Concurrent LLM routing calls are merged into one, None disables it
+        self.route_batcher = None
+        self.router_batch_size = router_batch_size
+        self.router_batch_window = router_batch_window
+        # generate_response calls that haven't finished routing yet
+        self.unrouted = 0
+        if router_batch_size > 1:
+            self.route_batcher = MicroBatcher(
+                self._route_batch,
+                window=self._route_batch_window,
+                max_size=router_batch_size,
+            )
+        # Ollama takes either a duration string or a number of seconds
+        if str(keep_alive).lstrip("-").isdigit():
+            keep_alive = int(keep_alive)
+        self.keep_alive = keep_alive
+        # Per prompt stage: calls, evaluated tokens, eval time and estimated savings
+        self.prompt_eval_stats = {}
+        # Per prompt stage: (prefix tokens, cold ns per token) measured at warm-up
+        self._prefix_baselines = {}
+        # Research context is compacted to about this many tokens, 0 disables it
+        self.research_token_budget = research_token_budget
+        self.compaction_stats = {"calls": 0, "raw_tokens": 0, "compacted_tokens": 0}
+        self.speculative = speculative
+        # Recent posts by prompt embedding, None disables it. Only backends
+        # that can embed text get one
+        if semantic_cache is None and SEMANTIC_CACHE_ENABLED:
+            if not self.backend.supports_embeddings:
+                print(f"Semantic cache disabled, {self.backend.name} can't embed text")
+            else:
+                semantic_cache = SemanticCache(
+                    lambda text: self.backend.embed(EMBEDDING_MODEL, text)
+                )
+        self.semantic_cache = semantic_cache
+        self.speculation_stats = {
+            "hits": 0,
+            "misses": 0,
+            "saved_s": 0.0,
+            "wasted_s": 0.0,
+        }
+
+    async def close(self):
+        """Close the backend's HTTP connections and the tool cache"""
+        await self.backend.close()
+        self.tool_cache.close()
+
+    async def _generate(self, payload, stage=None):
+        """Run one non-streaming generation on the backend"""
+        with track_cancellation(f"ollama_{stage or 'generate'}"):
+            result = await self.backend.generate(
+                {"keep_alive": self.keep_alive, **payload}
+            )
+        self._record_prompt_eval(stage, result)
+        record_ollama_response(stage, result)
+        return result
+
+    def _record_prompt_eval(self, stage, response):
+        """Accumulate Ollama's prompt-eval timings for a prompt stage"""
+        count = response.get("prompt_eval_count")
+        duration = response.get("prompt_eval_duration")
+        if stage is None or not count or duration is None:
+            return
+        stats = self.prompt_eval_stats.setdefault(
+            stage, {"calls": 0, "tokens": 0, "duration_ns": 0, "saved_ns": 0}
+        )
+        stats["calls"] += 1
+        stats["tokens"] += count
+        stats["duration_ns"] += duration
+        if stage in self._prefix_baselines:
+            prefix_tokens, ns_per_token = self._prefix_baselines[stage]
+            # Depending on the Ollama version prompt_eval_count is either the
+            # whole prompt or only the tokens that missed the prefix cache
+            full_tokens = count if count >= prefix_tokens else count + prefix_tokens
+            stats["saved_ns"] += max(0, full_tokens * ns_per_token - duration)
+
+    def prompt_eval_report(self):
+        """Summarize prompt-eval time per stage and the estimated time saved"""
+        return {
+            stage: {
+                "calls": stats["calls"],
+                "avg_prompt_tokens": stats["tokens"] / stats["calls"],
+                "avg_prompt_eval_ms": stats["duration_ns"] / stats["calls"] / 1e6,
+                "estimated_saved_ms": stats["saved_ns"] / 1e6,
+            }
+            for stage, stats in self.prompt_eval_stats.items()
+        }
+
+    def compaction_report(self):
+        """Summarize how many research context tokens compaction saved"""
+        stats = self.compaction_stats
+        return {
+            **stats,
+            "saved_tokens": stats["raw_tokens"] - stats["compacted_tokens"],
+        }
+
+    def speculation_report(self):
+        """Hit rate of speculative drafts and the time they saved or wasted"""
+        stats = self.speculation_stats
+        attempts = stats["hits"] + stats["misses"]
+        return {
+            **stats,
+            "hit_rate": stats["hits"] / attempts if attempts else 0.0,
+        }
+
+    async def warm_up_tools(self):
+        """Import and authenticate the research tools ahead of first use"""
+        return await self.tools.warm_up()
+
+    async def warm_up(self, model=DEFAULT_MODEL):
+        """Load the model and evaluate both static prompt prefixes once
+
+        Every backend in a pool is warmed, since any of them may get the next
+        request. The cold timings become the baseline the prefix cache
+        savings are estimated against.
+        """
+        backends = getattr(self.backend, "backends", [self.backend])
+        for stage, prefix in (
+            ("research", RESEARCH_PROMPT_PREFIX),
+            ("post", POST_PROMPT_PREFIX),
+        ):
+            payload = {
+                "keep_alive": self.keep_alive,
+                "model": model,
+                "prompt": prefix,
+                "stream": False,
+                "options": {"num_predict": 1},
             }
+            responses = await asyncio.gather(
+                *(backend.generate(payload) for backend in backends),
+                return_exceptions=True,
+            )
+            for response in responses:
+                if isinstance(response, Exception):
+                    print(f"Warm-up failed on a backend: {response}")
+                    continue
+                count = response.get("prompt_eval_count")
+                duration = response.get("prompt_eval_duration")
+                if count and duration:
+                    self._prefix_baselines[stage] = (count, duration / count)
+            if all(isinstance(response, Exception) for response in responses):
+                raise responses[0]
+
+    async def _generate_stream(
+        self, payload, on_text=None, max_chars=POST_CHAR_BUDGET, stage=None
+    ):
+        """Stream a completion from Ollama and stop once the post is complete"""
+        payload = {
+            "keep_alive": self.keep_alive,
+            **payload,
+            "stream": True,
+            # Rough chars-per-token ratio, so Ollama never decodes far past the budget
+            "options": {"num_predict": max_chars // 2, **payload.get("options", {})},
+        }
+        text = ""
+        final = {}
+        stream = self.backend.stream(payload)
+        try:
+            with track_cancellation(f"ollama_{stage or 'generate'}"):
+                async for chunk in stream:
+                    text += chunk.get("response", "")
+                    if chunk.get("done"):
+                        final = chunk
+                        self._record_prompt_eval(stage, chunk)
+                        record_ollama_response(stage, chunk)
+                        break
+                    if on_text:
+                        await on_text(text.strip())
+                    # A blank line means the post is over, anything beyond the
+                    # budget would be thrown away
+                    if len(text.strip()) > max_chars or "\n\n" in text.strip():
+                        break
+        finally:
+            # Closing the stream early, or on cancellation, aborts the
+            # generation on the backend
+            await stream.aclose()
+        return {**final, "response": self._trim_to_budget(text, max_chars)}
+
+    @staticmethod
+    def _trim_to_budget(text, max_chars):
+        """Cut text to the last sentence or word boundary within max_chars"""
+        text = text.strip().split("\n\n")[0]
+        if len(text) <= max_chars:
+            return text
+        text = text[:max_chars]
+        sentence_end = max(text.rfind(". "), text.rfind("! "), text.rfind("? "))
+        if sentence_end > max_chars // 2:
+            return text[: sentence_end + 1]
+        return text.rsplit(" ", 1)[0]
+
+    @staticmethod
+    def _salvage_json(text, pattern):
+        """Decode every complete JSON object starting where pattern matches"""
+        decoder = json.JSONDecoder()
+        objects = []
+        for match in re.finditer(pattern, text):
+            try:
+                objects.append(decoder.raw_decode(text, match.start())[0])
+            except json.JSONDecodeError:
+                continue
+        return objects
+
+    def _parse_tool_calls(self, response_text):
+        """Parse the router's JSON into [(func_name, params)], None if unusable
+
+        Output cut short by the token cap is salvaged call by call. Calls to
+        unknown functions or without their required arguments are dropped, and
+        None is returned if that leaves nothing of what the model asked for.
+        """
+        try:
+            data = json.loads(response_text)
+            calls = data.get("calls") if isinstance(data, dict) else None
+        except json.JSONDecodeError:
+            calls = self._salvage_json(response_text, r'\{\s*"name"')
+            if not calls:
+                return None
+        return self._valid_calls(calls)
+
+    def _parse_batched_routes(self, response_text, count):
+        """Parse {"routes": [...]} into count tool call lists, None where unusable
+
+        Output cut short by the token cap keeps the routes that completed.
+        """
+        try:
+            data = json.loads(response_text)
+            routes = data.get("routes") if isinstance(data, dict) else None
+        except json.JSONDecodeError:
+            routes = self._salvage_json(response_text, r'\{\s*"calls"')
+        if not isinstance(routes, list):
+            routes = []
+        routes = [
+            self._valid_calls(route.get("calls")) if isinstance(route, dict) else None
+            for route in routes[:count]
+        ]
+        return routes + [None] * (count - len(routes))
+
+    def _valid_calls(self, calls):
+        """Keep the known, well-formed calls, None if none of them was usable"""
+        if not isinstance(calls, list):
+            return None
+
+        function_calls = []
+        for call in calls:
+            if not isinstance(call, dict) or call.get("name") not in self.tools:
+                print(f"Ignoring unknown function call: {call}")
+                continue
+            params = call.get("arguments")
+            if not isinstance(params, dict) or not params.get("query"):
+                print(f"Ignoring function call without a query: {call}")
+                continue
+            if (call["name"], params) not in function_calls:
+                function_calls.append((call["name"], params))
+        # The model wanted research but none of it was usable
+        if calls and not function_calls:
+            return None
+        return function_calls
+
+    async def _execute_function(self, func_name, params, primary=True):
+        """Execute the specified function with given parameters
+
+        primary is False for hedged backup requests, their latency is only
+        recorded when they finish.
+        """
+        # Add new functions to agents/tools/registry.py as they become available
+        if func_name in self.tools:
+            cached = self.tool_cache.get(func_name, params)
+            if cached is not None:
+                TOOL_CALLS.inc(tool=func_name, cache="hit", outcome="ok")
+                return cached
+            start = time.perf_counter()
+            try:
+                function, async_function = await self.tools.resolve(func_name)
+                with TOOL_SECONDS.time(tool=func_name):
+                    # Prefer native async variants over running the sync one in a
+                    # thread. Cancelling those aborts their HTTP request, a thread
+                    # can't be stopped and runs to completion regardless
+                    with track_cancellation(func_name, abortable=bool(async_function)):
+                        if async_function is not None:
+                            result = await async_function(**params)
+                            self.tool_cache.set(func_name, params, result)
+                        else:
+                            result = await asyncio.to_thread(
+                                self._call_and_cache, func_name, function, params
+                            )
+                self.hedger.latency.observe(func_name, time.perf_counter() - start)
+                TOOL_CALLS.inc(tool=func_name, cache="miss", outcome="ok")
+                return result
+            except asyncio.CancelledError:
+                # A cancelled primary took at least this long, keep it in the
+                # tail so hedged calls don't drag the thresholds down. A
+                # cancelled backup lost a race it joined late, which says
+                # nothing about how slow the tool is
+                if primary:
+                    self.hedger.latency.observe(
+                        func_name, time.perf_counter() - start
+                    )
+                raise
+            except Exception as e:
+                TOOL_CALLS.inc(tool=func_name, cache="miss", outcome="error")
+                print(f"Error executing function {func_name}: {e}")
+                return None
+        return None
+
+
+    def _call_and_cache(self, func_name, function, params):
+        """Run a blocking tool and cache its result, from the worker thread
+
+        Caching here means a call abandoned by a timeout still fills the cache
+        for the next prompt instead of being thrown away.
+        """
+        result = function(**params)
+        self.tool_cache.set(func_name, params, result)
+        return result
+
+    async def _execute_with_deadline(self, func_name, params):
+        """Run one tool, hedged, giving up once its own deadline passes
+
+        Returns (tool that answered, result), the answering tool differs from
+        func_name when a backup provider won.
+        """
+        deadline = TOOL_DEADLINES.get(func_name, DEFAULT_TOOL_DEADLINE)
+        try:
+            return await asyncio.wait_for(
+                self.hedger.run(func_name, params, self._execute_function),
+                timeout=deadline,
+            )
+        except asyncio.TimeoutError:
+            TIMEOUTS.inc(operation=func_name)
+            print(f"Function {func_name} missed its {deadline}s deadline")
+            return func_name, None
+
+    def _compact_research(self, results, topic):
+        """Fit tool results to the research token budget and record the savings"""
+        context, raw_tokens, compacted_tokens = compact_research(
+            results, topic, self.research_token_budget
+        )
+        self.compaction_stats["calls"] += 1
+        self.compaction_stats["raw_tokens"] += raw_tokens
+        self.compaction_stats["compacted_tokens"] += compacted_tokens
+        RESEARCH_TOKENS.inc(raw_tokens, kind="raw")
+        RESEARCH_TOKENS.inc(compacted_tokens, kind="compacted")
+        return context
+
+    async def _run_research(self, function_calls, topic="", budget=RESEARCH_BUDGET):
+        """Run the selected tools concurrently and merge what returns in time
+
+        Returns the compacted context and the names of the tools that
+        contributed. Tools still running once the overall budget is spent, or
+        when the caller is cancelled, are cancelled too.
+        """
+        tasks = {
+            asyncio.create_task(
+                self._execute_with_deadline(func_name, params)
+            ): func_name
+            for func_name, params in function_calls
+        }
+        try:
+            done, pending = await asyncio.wait(tasks, timeout=budget)
+        finally:
+            # asyncio.wait leaves its tasks running if the wait is cancelled
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+        for task in pending:
+            TIMEOUTS.inc(operation="research_budget")
+            print(f"Cancelled {tasks[task]}, research budget exhausted")
+
+        results = []
+        # Keep the router's ordering so the merged context is deterministic
+        for task in tasks:
+            if task in done:
+                answered_by, result = task.result()
+                if result:
+                    results.append((answered_by, result))
+        if not results:
+            return "", []
+        context = self._compact_research(results, topic)
+        return context, list(dict.fromkeys(name for name, _ in results))
+
+    def _route_locally(self, prompt):
+        """Return the local router's tool calls, or None if it isn't confident"""
+        if self.router is None:
+            return None
+        function_calls = [
+            (func_name, params)
+            for func_name, params, confidence in self.router.route(prompt)
+            if confidence >= self.router_threshold
+        ]
+        return function_calls or None
+
+    def _fallback_route(self, prompt):
+        """Best guess when the LLM router's output can't be used at all"""
+        if self.router is not None:
+            function_calls = [
+                (func_name, params)
+                for func_name, params, _ in self.router.route(prompt)
+            ]
+            if function_calls:
+                return function_calls
+        return [("perplexity_web_search", {"query": prompt})]
+
+    def _route_batch_window(self, queued):
+        """Batch window scaled by the prompts that may still join the batch
+
+        Those are the other prompts still being routed, 0 of them means
+        nobody can join and the batch goes out at once.
+        """
+        joining = max(0, self.unrouted - queued)
+        return self.router_batch_window * min(
+            1.0, joining / max(1, self.router_batch_size - queued)
+        )
+
+    async def _route_with_llm(self, prompt, model):
+        """Ask the model which research functions to call"""
+        if self.route_batcher is not None:
+            return await self.route_batcher.submit((prompt, model))
+        return await self._route_one(prompt, model)
+
+    async def _route_one(self, prompt, model):
+        """Route a single prompt with its own LLM call"""
+        # Static prefix first so Ollama can reuse its KV cache across requests
+        research_prompt = f"{RESEARCH_PROMPT_PREFIX}\nTopic: {prompt}\n"
+
+        # Constrain the output to the routing schema and cap it at a few
+        # calls' worth of tokens so the model can't ramble
+        response = await self._generate(
+            {
+                "model": model,
+                "prompt": research_prompt,
+                "stream": False,
+                "format": ROUTING_SCHEMA,
+                "options": {"num_predict": ROUTER_MAX_TOKENS, "temperature": 0},
+            },
+            stage="research",
+        )
+        function_calls = self._parse_tool_calls(response["response"].strip())
+        if function_calls is None:
+            # Research is what makes posts worth reading, don't drop it
+            print(f"Unparseable routing output: {response['response']!r}")
+            ROUTES.inc(source="fallback")
+            return self._fallback_route(prompt)
+        ROUTES.inc(source="llm")
+        return function_calls
+
+    async def _route_many(self, prompts, model):
+        """Route several prompts with one LLM call, one tool call list each"""
+        topics = "\n".join(f"{i}. {prompt}" for i, prompt in enumerate(prompts, 1))
+        research_prompt = (
+            f"{RESEARCH_PROMPT_PREFIX}\nTopics:\n{topics}\n"
+            f'Respond with {{"routes": [...]}} holding one {{"calls": [...]}} '
+            f"entry per topic, in the same order ({len(prompts)} entries).\n"
+        )
+        response = await self._generate(
+            {
+                "model": model,
+                "prompt": research_prompt,
+                "stream": False,
+                "format": build_batch_routing_schema(ROUTING_SCHEMA, len(prompts)),
+                "options": {
+                    "num_predict": ROUTER_MAX_TOKENS * len(prompts),
+                    "temperature": 0,
+                },
+            },
+            stage="research",
+        )
+        routes = self._parse_batched_routes(
+            response["response"].strip(), len(prompts)
+        )
+        results = []
+        for prompt, function_calls in zip(prompts, routes):
+            if function_calls is None:
+                print(f"Unusable batched route for {prompt!r}")
+                ROUTES.inc(source="fallback")
+                function_calls = self._fallback_route(prompt)
+            else:
+                ROUTES.inc(source="llm")
+            results.append(function_calls)
+        return results
+
+    async def _route_batch(self, items):
+        """Route a micro-batch of (prompt, model), one LLM call per model"""
+        ROUTING_BATCH_SIZE.observe(len(items))
+        by_model = {}
+        for i, (prompt, model) in enumerate(items):
+            by_model.setdefault(model, []).append(i)
+
+        async def route(model, indexes):
+            if len(indexes) == 1:
+                return [await self._route_one(items[indexes[0]][0], model)]
+            return await self._route_many([items[i][0] for i in indexes], model)
+
+        groups = await asyncio.gather(
+            *(route(model, indexes) for model, indexes in by_model.items()),
+            return_exceptions=True,
+        )
+        results = [None] * len(items)
+        for indexes, group in zip(by_model.values(), groups):
+            for position, i in enumerate(indexes):
+                results[i] = group if isinstance(group, Exception) else group[position]
+        return results
+
+    @staticmethod
+    def _post_prompt(prompt, research_results=""):
+        """Build the post generation prompt, with research context if any"""
+        post_prompt = POST_PROMPT_PREFIX
+
+        # Add research results if available
+        if research_results:
+            post_prompt += f"\nHere is additional context that you can use to write such post:\n{research_results}"
         
+        post_prompt += f"\nTopic: {prompt}\n\nRespond with ONLY the tweet text, nothing else."
+        return post_prompt
+
+    async def _draft_post(self, prompt, model, max_chars, on_text, kept, timing):
+        """Write the no-context post, returning it with the seconds it took
+
+        Streamed within the post budget like the normal post, so cancelling
+        it aborts the decode. Partial text only reaches on_text once kept is
+        set, when routing picked no tools. timing gets the start time.
+        """
+        if self.route_batcher is not None:
+            # Let the batched routing call reach the backend first
+            await asyncio.sleep(self.route_batcher.until_flush())
+
+        async def forward(text):
+            if on_text is not None and kept.is_set():
+                await on_text(text)
+
+        timing["started"] = start = time.perf_counter()
+        response = await self._generate_stream(
+            {"model": model, "prompt": self._post_prompt(prompt)},
+            on_text=forward,
+            max_chars=max_chars,
+            stage="post",
+        )
+        return response, time.perf_counter() - start
+
+    async def _settle_draft(self, draft, research_needed, route_seconds, kept, timing):
+        """Use the speculative draft if routing picked no tools, else cancel it
+
+        Returns the draft's response or None. A hit saves the shorter of the
+        routing call and the draft, since they ran side by side instead of one
+        after the other. A miss wastes the decode time the draft got.
+        """
+        stats = self.speculation_stats
+        if research_needed:
+            wasted = 0.0
+            if draft.done() and not draft.cancelled() and not draft.exception():
+                wasted = draft.result()[1]
+            elif "started" in timing:
+                wasted = time.perf_counter() - timing["started"]
+            draft.cancel()
+            stats["misses"] += 1
+            stats["wasted_s"] += wasted
+            SPECULATIONS.inc(outcome="miss")
+            SPECULATION_SECONDS.inc(wasted, kind="wasted")
+            return None
+        kept.set()
+        try:
+            response, draft_seconds = await draft
+        except Exception as e:
+            print(f"Speculative draft failed, writing the post again: {e}")
+            stats["misses"] += 1
+            SPECULATIONS.inc(outcome="error")
+            return None
+        saved = min(route_seconds, draft_seconds)
+        stats["hits"] += 1
+        stats["saved_s"] += saved
+        SPECULATIONS.inc(outcome="hit")
+        SPECULATION_SECONDS.inc(saved, kind="saved")
+        return response
+
+    async def generate_response(
+        self,
+        prompt,
+        model=DEFAULT_MODEL,
+        stream=False,
+        on_text=None,
+        max_chars=POST_CHAR_BUDGET,
+        checkpoint=None,
+        on_checkpoint=None,
+    ):
+        """Send request to local Ollama instance
+
+        With stream=True the post is streamed token by token, on_text is awaited
+        with the partial text and generation stops once max_chars is exceeded.
+
+        checkpoint holds stage outputs saved by an earlier attempt, stages
+        found there are skipped. on_checkpoint(stage, data) is called with the
+        JSON-serializable output of each stage as it completes.
+
+        The result's "spans" holds the seconds spent in each stage that ran.
+        """
+        checkpoint = checkpoint or {}
+        # Stage outputs of this run, cached for similar prompts afterwards
+        produced = {}
+        # Seconds this prompt spent in each stage it ran
+        spans = {}
+
+        def save(stage, data):
+            produced.update(data)
+            if on_checkpoint is not None:
+                on_checkpoint(stage, data)
+
+        # Counted while routing is pending, see _route_batch_window
+        self.unrouted += 1
+        unrouted = True
+
+        def routing_done():
+            nonlocal unrouted
+            if unrouted:
+                self.unrouted -= 1
+                unrouted = False
+
+        try:
+            vector = None
+            if self.semantic_cache is not None and not checkpoint:
+                outcome, entry, vector = await self.semantic_cache.lookup(prompt)
+                if outcome == "reuse":
+                    # Close enough to post the recent draft again
+                    checkpoint = entry["data"]
+                elif outcome == "adapt":
+                    # Reuse the routing and research, write a fresh post
+                    checkpoint = {
+                        key: value
+                        for key, value in entry["data"].items()
+                        if key != "text"
+                    }
+                if outcome in ("reuse", "adapt"):
+                    print(
+                        f"Semantic cache {outcome} ({entry['similarity']:.3f}) "
+                        f"of {entry['prompt']!r}"
+                    )
+                    # Record the reused stages like computed ones
+                    for stage, keys in (
+                        ("routed", ("function_calls",)),
+                        ("researched", ("research", "tools_used")),
+                        ("generated", ("text", "tools_used")),
+                    ):
+                        if all(key in checkpoint for key in keys):
+                            save(stage, {key: checkpoint[key] for key in keys})
+
+            if "text" in checkpoint:
+                return {
+                    "text": checkpoint["text"],
+                    "tool_used": ", ".join(checkpoint.get("tools_used", [])),
+                    "spans": spans,
+                }
+
+            # First step: pick research tools, locally when the rules are
+            # confident and with the LLM otherwise
+            draft = None
+            # Set once the draft is kept, timing["started"] when it's sent
+            kept, timing = asyncio.Event(), {}
+            if "function_calls" in checkpoint:
+                function_calls = [tuple(call) for call in checkpoint["function_calls"]]
+            else:
+                route_started = time.perf_counter()
+                with stage_span(spans, "route"):
+                    function_calls = self._route_locally(prompt)
+                    if function_calls is None:
+                        route = asyncio.create_task(
+                            self._route_with_llm(prompt, model)
+                        )
+                        # Most LLM-routed topics need no research, so write
+                        # the no-context post while the router decides. It
+                        # starts after routing so it never delays it
+                        if self.speculative:
+                            draft = asyncio.create_task(
+                                self._draft_post(
+                                    prompt,
+                                    model,
+                                    max_chars,
+                                    on_text if stream else None,
+                                    kept,
+                                    timing,
+                                )
+                            )
+                        try:
+                            function_calls = await route
+                        except BaseException:
+                            route.cancel()
+                            if draft is not None:
+                                draft.cancel()
+                            raise
+                    else:
+                        ROUTES.inc(source="rules")
+                route_seconds = time.perf_counter() - route_started
+                save("routed", {"function_calls": function_calls})
+            routing_done()
+
+            response = None
+            if draft is not None:
+                response = await self._settle_draft(
+                    draft, bool(function_calls), route_seconds, kept, timing
+                )
+
+            research_results = checkpoint.get("research", "")
+            tools_used = checkpoint.get("tools_used", [])
+
+            if function_calls and "research" not in checkpoint:
+                with stage_span(spans, "research"):
+                    research_results, tools_used = await self._run_research(
+                        function_calls[:MAX_PARALLEL_TOOLS], topic=prompt
+                    )
+                save(
+                    "researched",
+                    {"research": research_results, "tools_used": tools_used},
+                )
+
+
+            # Second step: Tweet generation, unless the speculative draft
+            # already wrote it
+            if response is None:
+                post_prompt = self._post_prompt(prompt, research_results)
+
+                with stage_span(spans, "post"):
+                    if stream:
+                        response = await self._generate_stream(
+                            {"model": model, "prompt": post_prompt},
+                            on_text=on_text,
+                            max_chars=max_chars,
+                            stage="post",
+                        )
+                    else:
+                        response = await self._generate(
+                            {"model": model, "prompt": post_prompt, "stream": False},
+                            stage="post",
+                        )
+            text = response["response"].strip()
+            save("generated", {"text": text, "tools_used": tools_used})
+            if vector is not None:
+                self.semantic_cache.store(prompt, vector, produced)
+            return {
+                "text": text,
+                "tool_used": ", ".join(tools_used),
+                "spans": spans,
+            }
+
         except Exception as e:
             print(f"Error calling Ollama: {e}")
             return None
+        finally:
+            routing_done()
@@ -0,0 +1,327 @@
+import asyncio
+import threading
+import time
+from contextlib import contextmanager
+
+from aiohttp import web
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60)
+TOKEN_RATE_BUCKETS = (1, 2, 5, 10, 20, 40, 80, 160, 320)
+LOOKUP_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+SIMILARITY_BUCKETS = (0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.93, 0.95, 0.97, 0.99, 1)
+BATCH_SIZE_BUCKETS = (1, 2, 3, 4, 6, 8, 12, 16)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def render(self):
+        lines = [
+            f"# HELP {self.name} {self.documentation}",
+            f"# TYPE {self.name} {self.kind}",
+        ]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.extend(self._render_value(labels, value))
+        return lines
+
+    def _render_value(self, labels, value):
+        return [f"{self.name}{_format_labels(labels)} {value}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def total(self):
+        """Sum over every label set"""
+        with self._lock:
+            return sum(self._values.values())
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name, documentation):
+        super().__init__(name, documentation)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[tuple(sorted(labels.items()))] = value
+
+    def set_function(self, function, **labels):
+        """Read the value from function() at scrape time"""
+        self._functions[tuple(sorted(labels.items()))] = function
+
+    def render(self):
+        for labels, function in self._functions.items():
+            self.set(function(), **dict(labels))
+        return super().render()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            counts, total, count = self._values.get(
+                key, ([0] * len(self.buckets), 0.0, 0)
+            )
+            counts = [
+                c + (value <= bound) for c, bound in zip(counts, self.buckets)
+            ]
+            self._values[key] = (counts, total + value, count + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the with-block took, even if it raised"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _render_value(self, labels, value):
+        counts, total, count = value
+        buckets = list(zip(self.buckets, counts)) + [("+Inf", count)]
+        lines = [
+            f"{self.name}_bucket{_format_labels(labels + (('le', bound),))} {c}"
+            for bound, c in buckets
+        ]
+        lines.append(f"{self.name}_sum{_format_labels(labels)} {total}")
+        lines.append(f"{self.name}_count{_format_labels(labels)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds metrics and renders them in the Prometheus text format."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def _register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name, documentation):
+        return self._register(Counter(name, documentation))
+
+    def gauge(self, name, documentation):
+        return self._register(Gauge(name, documentation))
+
+    def histogram(self, name, documentation, buckets=LATENCY_BUCKETS):
+        return self._register(Histogram(name, documentation, buckets))
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = MetricsRegistry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "bluesky_agent_stage_seconds",
+    "Latency of each pipeline stage (queue, route, research, post, publish)",
+)
+TOOL_SECONDS = REGISTRY.histogram(
+    "bluesky_agent_tool_seconds", "Latency of research tool calls"
+)
+TOOL_CALLS = REGISTRY.counter(
+    "bluesky_agent_tool_calls_total",
+    "Research tool calls by cache result and outcome",
+)
+OLLAMA_TOKENS_PER_SECOND = REGISTRY.histogram(
+    "bluesky_agent_ollama_tokens_per_second",
+    "Ollama decode speed from eval_count / eval_duration",
+    buckets=TOKEN_RATE_BUCKETS,
+)
+ROUTES = REGISTRY.counter(
+    "bluesky_agent_routes_total",
+    "Routing decisions by source (rules, llm or fallback after bad LLM output)",
+)
+ROUTING_BATCH_SIZE = REGISTRY.histogram(
+    "bluesky_agent_routing_batch_size",
+    "Prompts routed together per micro-batch of LLM routing calls",
+    buckets=BATCH_SIZE_BUCKETS,
+)
+SPECULATIONS = REGISTRY.counter(
+    "bluesky_agent_speculative_drafts_total",
+    "Speculative no-context drafts by outcome (hit, miss, error)",
+)
+SPECULATION_SECONDS = REGISTRY.counter(
+    "bluesky_agent_speculative_seconds_total",
+    "Latency saved by speculative draft hits and decode time wasted on misses",
+)
+SEMANTIC_CACHE = REGISTRY.counter(
+    "bluesky_agent_semantic_cache_lookups_total",
+    "Semantic cache lookups by outcome (reuse, adapt, miss, error)",
+)
+SEMANTIC_CACHE_LOOKUP_SECONDS = REGISTRY.histogram(
+    "bluesky_agent_semantic_cache_lookup_seconds",
+    "Semantic cache lookup latency, embedding included",
+    buckets=LOOKUP_BUCKETS,
+)
+SEMANTIC_SIMILARITY = REGISTRY.histogram(
+    "bluesky_agent_semantic_cache_similarity",
+    "Cosine similarity of the nearest cached prompt, for tuning thresholds",
+    buckets=SIMILARITY_BUCKETS,
+)
+RESEARCH_TOKENS = REGISTRY.counter(
+    "bluesky_agent_research_context_tokens_total",
+    "Estimated research context tokens before (raw) and after compaction",
+)
+BACKEND_OUTSTANDING = REGISTRY.gauge(
+    "bluesky_agent_backend_outstanding_requests",
+    "Generation requests in flight per LLM backend",
+)
+BACKEND_HEALTHY = REGISTRY.gauge(
+    "bluesky_agent_backend_healthy", "1 if the LLM backend passed its last check"
+)
+BACKEND_FAILOVERS = REGISTRY.counter(
+    "bluesky_agent_backend_failovers_total",
+    "Requests moved to another LLM backend after this one failed",
+)
+NEWS_INDEX_LOOKUPS = REGISTRY.counter(
+    "bluesky_agent_news_index_lookups_total",
+    "OpenBB tool lookups in the local news index by outcome (hit, miss, stale)",
+)
+NEWS_INDEX_SIZE = REGISTRY.gauge(
+    "bluesky_agent_news_index_articles", "Articles held in the local news index"
+)
+NEWS_INDEX_BYTES = REGISTRY.gauge(
+    "bluesky_agent_news_index_bytes", "Estimated memory used by the news index"
+)
+HEDGES = REGISTRY.counter(
+    "bluesky_agent_hedged_tool_calls_total",
+    "Tool calls that got a backup request, by backup tool and reason (slow, error)",
+)
+HEDGE_WINS = REGISTRY.counter(
+    "bluesky_agent_hedge_wins_total",
+    "Hedged tool calls by which request answered first (primary, backup)",
+)
+CANCELLATIONS = REGISTRY.counter(
+    "bluesky_agent_cancellations_total",
+    "Operations cancelled mid-flight, aborted or left running in a thread",
+)
+RECLAIMED_SECONDS = REGISTRY.counter(
+    "bluesky_agent_reclaimed_seconds_total",
+    "Estimated backend and API seconds freed by aborting cancelled operations",
+)
+MESSAGES = REGISTRY.counter(
+    "bluesky_agent_messages_total", "Telegram messages handled by outcome"
+)
+TIMEOUTS = REGISTRY.counter(
+    "bluesky_agent_timeouts_total", "Operations that hit their timeout"
+)
+QUEUE_DEPTH = REGISTRY.gauge(
+    "bluesky_agent_queue_depth", "Messages waiting for a generation slot"
+)
+ACTIVE_GENERATIONS = REGISTRY.gauge(
+    "bluesky_agent_active_generations", "Generations currently running"
+)
+
+
+def record_ollama_response(stage, response):
+    """Record tokens/sec from the eval fields of an Ollama response"""
+    count = response.get("eval_count")
+    duration = response.get("eval_duration")
+    if stage is not None and count and duration:
+        OLLAMA_TOKENS_PER_SECOND.observe(count / (duration / 1e9), stage=stage)
+
+
+@contextmanager
+def stage_span(spans, stage):
+    """Time a pipeline stage into STAGE_SECONDS and the request's spans dict
+
+    spans keeps one request's own stage durations, so a slow post can be
+    traced to the stage that made it slow.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        STAGE_SECONDS.observe(seconds, stage=stage)
+        spans[stage] = spans.get(stage, 0.0) + seconds
+
+
+def format_spans(spans):
+    """Render stage durations as "route=0.12s research=1.50s" for logs"""
+    return " ".join(f"{stage}={seconds:.2f}s" for stage, seconds in spans.items())
+
+
+# Moving average of how long each operation takes when it runs to completion
+_typical_seconds = {}
+
+
+@contextmanager
+def track_cancellation(operation, abortable=True):
+    """Count the with-block as cancelled work if CancelledError escapes it
+
+    An aborted operation (abortable, e.g. an HTTP request whose connection is
+    closed) is credited with the part of its typical run time it hadn't used
+    yet. Blocking calls running in a thread can't be stopped, so they are
+    only counted as abandoned.
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except asyncio.CancelledError:
+        elapsed = time.perf_counter() - start
+        if abortable:
+            CANCELLATIONS.inc(operation=operation, outcome="aborted")
+            reclaimed = _typical_seconds.get(operation, 0.0) - elapsed
+            RECLAIMED_SECONDS.inc(max(reclaimed, 0.0), operation=operation)
+        else:
+            CANCELLATIONS.inc(operation=operation, outcome="abandoned")
+        raise
+    else:
+        elapsed = time.perf_counter() - start
+        typical = _typical_seconds.get(operation)
+        _typical_seconds[operation] = (
+            elapsed if typical is None else 0.8 * typical + 0.2 * elapsed
+        )
+
+
+async def start_metrics_server(host, port, registry=REGISTRY):
+    """Serve registry on http://host:port/metrics, returns the runner to clean up"""
+
+    async def metrics(_request):
+        return web.Response(
+            text=registry.render(), content_type="text/plain", charset="utf-8"
+        )
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
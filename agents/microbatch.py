@@ -0,0 +1,87 @@
+import asyncio
+
+
+class MicroBatcher:
+    """Groups calls that arrive close together into one batched call.
+
+    submit(item) waits up to window seconds for more items, or until max_size
+    are queued, then process(items) is awaited once for the whole batch. It
+    must return one result per item, in order. A result that is an exception
+    is raised to that item's caller only.
+
+    window may also be a callable, given the number of queued items and
+    returning the seconds to wait. Returning 0 flushes the batch right away.
+    """
+
+    def __init__(self, process, window=0.02, max_size=8):
+        self.process = process
+        self.window = window
+        self.max_size = max_size
+        self.counts = {"items": 0, "batches": 0}
+        self._pending = []
+        self._timer = None
+        # Batch task -> futures of its callers
+        self._running = {}
+
+    async def submit(self, item):
+        """Queue item for the next batch and return its result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((item, future))
+        window = self.window
+        if callable(window):
+            window = window(len(self._pending))
+        if len(self._pending) >= self.max_size or window <= 0:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(window, self._flush)
+        try:
+            return await future
+        except asyncio.CancelledError:
+            self._pending = [(i, f) for i, f in self._pending if f is not future]
+            # Nobody is waiting for that batch any more, abort it
+            for task, futures in self._running.items():
+                if future in futures and all(f.cancelled() for f in futures):
+                    task.cancel()
+            raise
+
+    def until_flush(self):
+        """Seconds until the queued items are sent, 0 when none are waiting"""
+        if self._timer is None:
+            return 0.0
+        return max(0.0, self._timer.when() - asyncio.get_running_loop().time())
+
+    def _flush(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch = [(item, f) for item, f in self._pending if not f.done()]
+        self._pending = []
+        if not batch:
+            return
+        self.counts["items"] += len(batch)
+        self.counts["batches"] += 1
+        task = asyncio.create_task(self._run(batch))
+        self._running[task] = [future for _, future in batch]
+        task.add_done_callback(lambda done: self._running.pop(done, None))
+
+    async def _run(self, batch):
+        try:
+            results = await self.process([item for item, _ in batch])
+        except Exception as e:
+            results = [e] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if future.done():
+                continue
+            if isinstance(result, Exception):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def stats(self):
+        """Items and batches so far, with the mean batch size"""
+        batches = self.counts["batches"]
+        return {
+            **self.counts,
+            "mean_size": self.counts["items"] / batches if batches else 0.0,
+        }
@@ -0,0 +1,306 @@
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from .compaction import STOPWORDS
+from .metrics import NEWS_INDEX_BYTES, NEWS_INDEX_LOOKUPS, NEWS_INDEX_SIZE
+from .router import COMPANY_TICKERS
+
+NEWS_INGEST_ENABLED = os.getenv("NEWS_INGEST", "").lower() in ("1", "true", "yes")
+# Seconds between background pulls of recent news
+NEWS_INGEST_INTERVAL = float(os.getenv("NEWS_INGEST_INTERVAL", "300"))
+NEWS_INGEST_LIMIT = int(os.getenv("NEWS_INGEST_LIMIT", "100"))
+# Tickers whose company news is pulled too, comma separated
+NEWS_INGEST_SYMBOLS = os.getenv(
+    "NEWS_INGEST_SYMBOLS", ",".join(sorted(set(COMPANY_TICKERS.values())))
+)
+# Seconds after the last pull (or live fetch, per symbol) the index stops
+# answering and the tools fetch live again
+NEWS_INDEX_STALE_AFTER = float(os.getenv("NEWS_INDEX_STALE_AFTER", "900"))
+# Approximate memory cap, the oldest articles are dropped beyond it
+NEWS_INDEX_MAX_MB = float(os.getenv("NEWS_INDEX_MAX_MB", "64"))
+# Matching articles a query needs to be answered from the index
+NEWS_INDEX_MIN_RESULTS = 3
+
+# Rough per-article and per-posting overhead on top of the text itself
+ARTICLE_OVERHEAD_BYTES = 400
+POSTING_BYTES = 80
+
+logger = logging.getLogger(__name__)
+
+_TICKER = re.compile(r"^\$?[A-Za-z]{1,5}(\.[A-Za-z])?$")
+
+
+def _terms(text):
+    words = re.findall(r"[a-z0-9]+", str(text).lower())
+    return {w for w in words if len(w) > 2 and w not in STOPWORDS}
+
+
+def _symbols(value):
+    if isinstance(value, str):
+        value = value.split(",")
+    return {str(s).strip().upper() for s in value or () if str(s).strip()}
+
+
+def company_symbols(query):
+    """Split a company query into tickers and the names it can't resolve
+
+    Known company names map to their ticker and cashtags or all-caps words
+    of up to 5 letters count as tickers, so "Nvidia, $amd, Snowflake" gives
+    ("AMD,NVDA", ["Snowflake"]).
+    """
+    symbols = set()
+    names = []
+    for part in str(query).split(","):
+        part = part.strip()
+        lowered = part.lower()
+        named = {
+            ticker
+            for name, ticker in COMPANY_TICKERS.items()
+            if re.search(rf"\b{re.escape(name)}\b", lowered)
+        }
+        if named:
+            symbols |= named
+        elif _TICKER.match(part) and (part.startswith("$") or part.isupper()):
+            symbols.add(part.lstrip("$").upper())
+        elif part:
+            names.append(part)
+    return ",".join(sorted(symbols)), names
+
+
+def _article(item):
+    """Plain dict of a news result, from an OBBject row or a dict"""
+    if hasattr(item, "model_dump"):
+        item = item.model_dump()
+    return dict(item)
+
+
+class NewsIndex:
+    """In-memory news store with an inverted index and per-company lookup.
+
+    Articles are keyed by id (or url, or title) and indexed by the words of
+    their title and body and by their ticker symbols. search() and
+    company() return None when they can't answer, because the index is
+    stale or has too few matches, so the caller fetches live instead.
+    """
+
+    def __init__(
+        self,
+        stale_after=NEWS_INDEX_STALE_AFTER,
+        max_bytes=int(NEWS_INDEX_MAX_MB * 1024 * 1024),
+        min_results=NEWS_INDEX_MIN_RESULTS,
+    ):
+        self.stale_after = stale_after
+        self.max_bytes = max_bytes
+        self.min_results = min_results
+        self.bytes = 0
+        self.last_ingest = None
+        self.counts = {"hit": 0, "miss": 0, "stale": 0}
+        self._articles = OrderedDict()
+        self._postings = {}
+        self._by_symbol = {}
+        self._symbol_fetched = {}
+        self._lock = threading.Lock()
+        NEWS_INDEX_SIZE.set_function(lambda: len(self._articles))
+        NEWS_INDEX_BYTES.set_function(lambda: self.bytes)
+
+    def __len__(self):
+        return len(self._articles)
+
+    @staticmethod
+    def _key(article):
+        return article.get("id") or article.get("url") or article.get("title")
+
+    def add(self, results, symbols=(), ingested=False):
+        """Index news results, newest last, and mark symbols as fetched now
+
+        ingested marks a full background pull, which makes world searches
+        fresh again.
+        """
+        items = getattr(results, "results", results) or []
+        now = time.time()
+        with self._lock:
+            for item in items:
+                article = _article(item)
+                key = self._key(article)
+                if not key or not article.get("title"):
+                    continue
+                self._remove(key)
+                self._insert(key, article)
+            for symbol in _symbols(symbols):
+                self._symbol_fetched[symbol] = now
+            if ingested:
+                self.last_ingest = now
+            self._evict()
+
+    def _insert(self, key, article):
+        terms = _terms(article["title"]) | _terms(article.get("text") or "")
+        symbols = _symbols(article.get("symbols"))
+        size = (
+            ARTICLE_OVERHEAD_BYTES
+            + sum(len(str(value)) for value in article.values())
+            + POSTING_BYTES * (len(terms) + len(symbols))
+        )
+        self._articles[key] = (article, terms, symbols, size)
+        for term in terms:
+            self._postings.setdefault(term, set()).add(key)
+        for symbol in symbols:
+            self._by_symbol.setdefault(symbol, set()).add(key)
+        self.bytes += size
+
+    def _remove(self, key):
+        entry = self._articles.pop(key, None)
+        if entry is None:
+            return
+        _, terms, symbols, size = entry
+        for index, names in ((self._postings, terms), (self._by_symbol, symbols)):
+            for name in names:
+                keys = index.get(name)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del index[name]
+        self.bytes -= size
+
+    def _evict(self):
+        while self.bytes > self.max_bytes and self._articles:
+            self._remove(next(iter(self._articles)))
+
+    def _fresh(self, fetched_at):
+        return fetched_at is not None and time.time() - fetched_at < self.stale_after
+
+    def _newest(self, keys, limit, title_terms=frozenset()):
+        """Articles for keys, most title matches first, then newest"""
+        articles = [self._articles[key][0] for key in keys]
+        articles.sort(
+            key=lambda a: (len(_terms(a["title"]) & title_terms), str(a.get("date"))),
+            reverse=True,
+        )
+        return articles[:limit]
+
+    def _count(self, tool, outcome):
+        self.counts[outcome] += 1
+        NEWS_INDEX_LOOKUPS.inc(tool=tool, outcome=outcome)
+
+    def search(self, query, limit=5):
+        """Articles matching every word of query, None if the index can't answer"""
+        terms = _terms(query)
+        with self._lock:
+            if not self._fresh(self.last_ingest):
+                self._count("openbb_news_search", "stale")
+                return None
+            postings = sorted(
+                (self._postings.get(term, set()) for term in terms), key=len
+            )
+            keys = set.intersection(*postings) if postings else set()
+            if len(keys) < min(limit, self.min_results):
+                self._count("openbb_news_search", "miss")
+                return None
+            self._count("openbb_news_search", "hit")
+            return self._newest(keys, limit, terms)
+
+    def company(self, query, limit=5):
+        """Newest articles on the companies in query, None if stale or missing"""
+        symbols = _symbols(company_symbols(query)[0])
+        with self._lock:
+            if not symbols or not all(
+                self._fresh(self._symbol_fetched.get(s)) for s in symbols
+            ):
+                self._count("openbb_news_on_company_search", "stale")
+                return None
+            keys = set().union(*(self._by_symbol.get(s, set()) for s in symbols))
+            if not keys:
+                # A shared pull may have had no room for this company's news
+                self._count("openbb_news_on_company_search", "miss")
+                return None
+            self._count("openbb_news_on_company_search", "hit")
+            return self._newest(keys, limit)
+
+    def symbols(self):
+        """Ticker symbols that have articles in the index"""
+        with self._lock:
+            return set(self._by_symbol)
+
+    def stats(self):
+        """Lookup outcomes and the index size"""
+        with self._lock:
+            return {
+                **self.counts,
+                "articles": len(self._articles),
+                "terms": len(self._postings),
+                "symbols": len(self._by_symbol),
+                "mb": round(self.bytes / (1024 * 1024), 2),
+                "last_ingest_age_s": (
+                    round(time.time() - self.last_ingest, 1)
+                    if self.last_ingest is not None
+                    else None
+                ),
+            }
+
+
+# Shared by the OpenBB tools and the background ingester
+NEWS_INDEX = NewsIndex()
+
+
+class NewsIngester:
+    """Periodically pulls recent news into a NewsIndex in the background.
+
+    fetch_world(limit) and fetch_company(symbols, limit) are blocking calls
+    returning news results, they run in a worker thread.
+    """
+
+    def __init__(
+        self,
+        fetch_world,
+        fetch_company,
+        index=NEWS_INDEX,
+        interval=NEWS_INGEST_INTERVAL,
+        limit=NEWS_INGEST_LIMIT,
+        symbols=NEWS_INGEST_SYMBOLS,
+    ):
+        self.fetch_world = fetch_world
+        self.fetch_company = fetch_company
+        self.index = index
+        self.interval = interval
+        self.limit = limit
+        self.symbols = ",".join(sorted(_symbols(symbols)))
+        self._task = None
+
+    def ingest(self):
+        """Pull world and company news once, returns seconds it took"""
+        start = time.perf_counter()
+        world = self.fetch_world(self.limit)
+        company = self.fetch_company(self.symbols, self.limit) if self.symbols else []
+        self.index.add(company, symbols=self.symbols)
+        self.index.add(world, ingested=True)
+        return time.perf_counter() - start
+
+    async def _run(self):
+        while True:
+            try:
+                seconds = await asyncio.to_thread(self.ingest)
+                logger.info(
+                    "Ingested news in %.2fs, %d articles indexed",
+                    seconds,
+                    len(self.index),
+                )
+            except Exception as e:
+                logger.warning("News ingestion failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -1,9 +1,16 @@
+import asyncio
 from mlx_lm import load, generate
 import os
 from dotenv import load_dotenv
 
+from .backends import Backend
+
+
+class LanguageModelWrapper(Backend):
+    """Fine-tuned Phi-3 running locally on MLX, usable as a generation backend."""
+
+    name = "phi-3-mini-mlx"
 
-class LanguageModelWrapper:
     def __init__(self):
         # Load environment variables
         load_dotenv()
@@ -26,3 +33,11 @@ class LanguageModelWrapper:
         return generate(
             self.model, tokenizer=self.tokenizer, prompt=prompt, max_tokens=max_tokens
         )
+
+    async def generate(self, payload):
+        """Backend interface: run the model on an Ollama-style payload in a thread"""
+        max_tokens = payload.get("options", {}).get("num_predict", 200)
+        text = await asyncio.to_thread(
+            self.generate_response, payload["prompt"], max_tokens
+        )
+        return {"response": text, "done": True}
@@ -0,0 +1,138 @@
+import re
+
+# Confidence the LanguageModelWrapper needs before skipping the LLM router
+ROUTER_CONFIDENCE_THRESHOLD = 0.8
+
+# Company names people type instead of tickers
+COMPANY_TICKERS = {
+    "apple": "AAPL",
+    "microsoft": "MSFT",
+    "nvidia": "NVDA",
+    "google": "GOOGL",
+    "alphabet": "GOOGL",
+    "amazon": "AMZN",
+    "meta": "META",
+    "facebook": "META",
+    "tesla": "TSLA",
+    "netflix": "NFLX",
+    "amd": "AMD",
+    "intel": "INTC",
+    "palantir": "PLTR",
+    "salesforce": "CRM",
+    "oracle": "ORCL",
+    "coinbase": "COIN",
+    "jpmorgan": "JPM",
+    "goldman sachs": "GS",
+    "berkshire": "BRK.B",
+}
+
+# Tickers the rules trust when written bare, without a cashtag
+KNOWN_TICKERS = set(COMPANY_TICKERS.values())
+
+# Company names that are also everyday words, only trusted next to finance terms
+AMBIGUOUS_NAMES = {"apple", "amazon", "meta", "oracle", "intel"}
+
+# All-caps words that look like tickers but are not
+NON_TICKERS = set(
+    "AI API CEO CFO CTO ETF EU FED GDP GPU IPO LLM ML OK OSS SEC UK US USA USD "
+    "VC AGI CPI FOMC OPENBB".split()
+)
+
+CASHTAG_PATTERN = re.compile(r"\$([A-Za-z]{1,5}(?:\.[A-Za-z])?)\b")
+TICKER_PATTERN = re.compile(r"\b([A-Z]{2,5})\b")
+
+SOCIAL_KEYWORDS = re.compile(
+    r"\b(twitter|tweets?|on x|x users|trending|viral|reactions?|sentiment|"
+    r"people (are )?saying|social media)\b",
+    re.IGNORECASE,
+)
+NEWS_KEYWORDS = re.compile(
+    r"\b(news|headlines?|breaking|announced|announcement)\b",
+    re.IGNORECASE,
+)
+# Hint at recency but are common in any prompt, not enough on their own
+WEAK_NEWS_KEYWORDS = re.compile(r"\b(today|this week|latest)\b", re.IGNORECASE)
+FINANCE_KEYWORDS = re.compile(
+    r"\b(stocks?|shares?|earnings|revenue|guidance|quarter|q[1-4]|deliveries|"
+    r"market cap|valuation|ipo|dividend|buyback|investors?|analysts?|ceo)\b",
+    re.IGNORECASE,
+)
+BACKGROUND_KEYWORDS = re.compile(
+    r"\b(what is|what are|explain|history of|background|how does|who is)\b",
+    re.IGNORECASE,
+)
+
+
+class RuleRouter:
+    """Keyword and ticker-pattern router that picks tools in microseconds.
+
+    route() returns (func_name, params, confidence) tuples. An empty list means
+    the rules have no opinion and the LLM router should decide. Only cashtags,
+    known tickers and company names score above the default threshold, other
+    all-caps words (RAG, NASA, JSON) are left to the LLM.
+    """
+
+    def __init__(self, extra_tickers=None):
+        # extra_tickers() returns more symbols, e.g. ingested news'. Many are
+        # everyday words (IT, ON, NOW, OPEN), so they're only trusted bare
+        # next to finance terms
+        self.extra_tickers = extra_tickers
+
+    def _known_tickers(self, finance):
+        if self.extra_tickers is None or not finance:
+            return KNOWN_TICKERS
+        return KNOWN_TICKERS | set(self.extra_tickers())
+
+    def _tickers(self, prompt):
+        """Return (confident tickers, confidence) and the unsure ones"""
+        tickers = [t.upper() for t in CASHTAG_PATTERN.findall(prompt)]
+        if tickers:
+            return list(dict.fromkeys(tickers)), 0.95, []
+        bare = []
+        # Shouted prompts are all caps, bare tickers can't be told apart there
+        if not prompt.isupper():
+            bare = [t for t in TICKER_PATTERN.findall(prompt) if t not in NON_TICKERS]
+        finance = FINANCE_KEYWORDS.search(prompt)
+        known = self._known_tickers(finance)
+        tickers = [t for t in bare if t in known]
+        unsure = [t for t in bare if t not in known]
+        lowered = prompt.lower()
+        for name, ticker in COMPANY_TICKERS.items():
+            if re.search(rf"\b{re.escape(name)}\b", lowered):
+                # "Apple pie recipes" is not about AAPL
+                if name in AMBIGUOUS_NAMES and not finance:
+                    unsure.append(ticker)
+                else:
+                    tickers.append(ticker)
+        return (
+            list(dict.fromkeys(tickers)),
+            0.85,
+            [t for t in dict.fromkeys(unsure) if t not in tickers],
+        )
+
+    def route(self, prompt):
+        """Return the tools the rules are confident about for this prompt"""
+        decisions = []
+        tickers, confidence, unsure = self._tickers(prompt)
+        if tickers:
+            decisions.append(
+                (
+                    "openbb_news_on_company_search",
+                    {"query": ",".join(tickers)},
+                    confidence,
+                )
+            )
+        elif unsure:
+            # Maybe a ticker, only used if the LLM router's output is unusable
+            decisions.append(
+                ("openbb_news_on_company_search", {"query": ",".join(unsure)}, 0.6)
+            )
+        if SOCIAL_KEYWORDS.search(prompt):
+            decisions.append(("grok_x_search", {"query": prompt}, 0.85))
+        if not tickers and NEWS_KEYWORDS.search(prompt):
+            decisions.append(("openbb_news_search", {"query": prompt}, 0.8))
+        elif not tickers and WEAK_NEWS_KEYWORDS.search(prompt):
+            decisions.append(("openbb_news_search", {"query": prompt}, 0.6))
+        if BACKGROUND_KEYWORDS.search(prompt):
+            decisions.append(("perplexity_web_search", {"query": prompt}, 0.7))
+        return decisions
@@ -0,0 +1,101 @@
+import asyncio
+from collections import OrderedDict, deque
+
+
+class QueueFullError(Exception):
+    """Raised when a job is rejected because the queue is at capacity."""
+
+
+class FairScheduler:
+    """Bounded job queue with a concurrency cap and per-user round-robin.
+
+    At most max_concurrency jobs run at once. Waiting jobs are queued per user
+    and slots are handed out one user at a time, so a burst from one user
+    can't starve everyone else.
+    """
+
+    def __init__(self, max_concurrency=1, max_queue=20, max_per_user=5):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self.active = 0
+        self._queues = OrderedDict()
+
+    @property
+    def queued(self):
+        """Number of jobs waiting for a slot"""
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _position(self, user_id):
+        """Estimate where a new job from user_id lands in round-robin order"""
+        own = len(self._queues.get(user_id, ()))
+        others = sum(
+            min(len(queue), own + 1)
+            for other, queue in self._queues.items()
+            if other != user_id
+        )
+        return own + others + 1
+
+    def _dispatch(self):
+        """Hand free slots to waiting jobs, rotating through users"""
+        while self.active < self.max_concurrency and self._queues:
+            user_id, queue = next(iter(self._queues.items()))
+            waiter = queue.popleft()
+            if queue:
+                # Move the user to the back so the others go first
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            if waiter.done():
+                continue
+            self.active += 1
+            waiter.set_result(None)
+
+    def _remove(self, user_id, waiter):
+        queue = self._queues.get(user_id)
+        if queue and waiter in queue:
+            queue.remove(waiter)
+            if not queue:
+                del self._queues[user_id]
+
+    async def _acquire(self, user_id, on_queued=None):
+        if self.active < self.max_concurrency and not self._queues:
+            self.active += 1
+            return
+        if self.queued >= self.max_queue:
+            raise QueueFullError("The queue is full, please try again later.")
+        if len(self._queues.get(user_id, ())) >= self.max_per_user:
+            raise QueueFullError(
+                f"You already have {self.max_per_user} messages waiting."
+            )
+
+        position = self._position(user_id)
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_id, deque()).append(waiter)
+        try:
+            if on_queued is not None:
+                await on_queued(position)
+            await waiter
+        except BaseException:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted right as we failed, pass it on
+                self._release()
+            else:
+                self._remove(user_id, waiter)
+            raise
+
+    def _release(self):
+        self.active -= 1
+        self._dispatch()
+
+    async def run(self, user_id, job, on_queued=None):
+        """Wait for a fair slot, then run and return await job()
+
+        on_queued is awaited with the estimated queue position when the job
+        has to wait. Raises QueueFullError when the queue can't take it.
+        """
+        await self._acquire(user_id, on_queued)
+        try:
+            return await job()
+        finally:
+            self._release()
@@ -0,0 +1,211 @@
+import math
+import os
+import random
+import time
+from collections import OrderedDict
+
+from .metrics import (
+    SEMANTIC_CACHE,
+    SEMANTIC_CACHE_LOOKUP_SECONDS,
+    SEMANTIC_SIMILARITY,
+)
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE", "").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+EMBEDDING_MODEL = os.getenv("OLLAMA_EMBEDDING_MODEL", "nomic-embed-text")
+# Cosine similarity above which a recent post is reused as is, and the lower
+# one above which its research is reused and only the post is rewritten
+SEMANTIC_REUSE_THRESHOLD = float(os.getenv("SEMANTIC_REUSE_THRESHOLD", "0.97"))
+SEMANTIC_ADAPT_THRESHOLD = float(os.getenv("SEMANTIC_ADAPT_THRESHOLD", "0.90"))
+# Seconds a cached post stays fresh enough to reuse
+SEMANTIC_CACHE_TTL = float(os.getenv("SEMANTIC_CACHE_TTL", "1800"))
+SEMANTIC_CACHE_MAX_ENTRIES = 512
+
+
+def _normalize(vector):
+    norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+    return [x / norm for x in vector]
+
+
+def _dot(a, b):
+    return sum(x * y for x, y in zip(a, b))
+
+
+class VectorIndex:
+    """Approximate nearest neighbour index over unit vectors.
+
+    Random-hyperplane LSH: each of several tables hashes a vector to the
+    signs of its projections, and only vectors sharing a bucket in some
+    table are compared exactly. Small indexes are simply scanned.
+    """
+
+    def __init__(self, bits=10, tables=8, brute_force_limit=64, seed=0):
+        self.bits = bits
+        self.tables = tables
+        self.brute_force_limit = brute_force_limit
+        self._random = random.Random(seed)
+        self._planes = None
+        self._buckets = [{} for _ in range(tables)]
+        self._vectors = {}
+
+    def __len__(self):
+        return len(self._vectors)
+
+    def _signatures(self, vector):
+        if self._planes is None:
+            # Hyperplanes are drawn once the embedding dimension is known
+            self._planes = [
+                [
+                    [self._random.gauss(0, 1) for _ in vector]
+                    for _ in range(self.bits)
+                ]
+                for _ in range(self.tables)
+            ]
+        return [
+            sum(1 << i for i, plane in enumerate(planes) if _dot(plane, vector) >= 0)
+            for planes in self._planes
+        ]
+
+    def add(self, key, vector):
+        signatures = self._signatures(vector)
+        self._vectors[key] = (vector, signatures)
+        for buckets, signature in zip(self._buckets, signatures):
+            buckets.setdefault(signature, set()).add(key)
+
+    def remove(self, key):
+        vector_signatures = self._vectors.pop(key, None)
+        if vector_signatures is None:
+            return
+        for buckets, signature in zip(self._buckets, vector_signatures[1]):
+            bucket = buckets.get(signature)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del buckets[signature]
+
+    def nearest(self, vector):
+        """Return (similarity, key) of the closest vector found, or None"""
+        if not self._vectors:
+            return None
+        if len(self._vectors) <= self.brute_force_limit:
+            candidates = self._vectors.keys()
+        else:
+            candidates = set()
+            for buckets, signature in zip(self._buckets, self._signatures(vector)):
+                candidates |= buckets.get(signature, set())
+        return max(
+            ((_dot(vector, self._vectors[key][0]), key) for key in candidates),
+            default=None,
+        )
+
+
+class SemanticCache:
+    """Recent posts keyed by the embedding of the prompt that produced them.
+
+    lookup() embeds a prompt and finds the most similar fresh entry. Above
+    reuse_threshold the cached post can be returned as is. Above
+    adapt_threshold its routing and research can be reused so only the
+    post itself is rewritten. Entries expire after ttl seconds and the
+    least recently used go first once max_entries is reached.
+    """
+
+    def __init__(
+        self,
+        embed,
+        reuse_threshold=SEMANTIC_REUSE_THRESHOLD,
+        adapt_threshold=SEMANTIC_ADAPT_THRESHOLD,
+        ttl=SEMANTIC_CACHE_TTL,
+        max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+    ):
+        # embed(text) is awaited and returns the embedding vector
+        self.embed = embed
+        self.reuse_threshold = reuse_threshold
+        self.adapt_threshold = adapt_threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.index = VectorIndex()
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self.counts = {"reuse": 0, "adapt": 0, "miss": 0, "error": 0}
+        self.lookup_seconds = []
+
+    def _expire(self):
+        """Drop stale entries, then the least recently used beyond max_entries"""
+        cutoff = time.time() - self.ttl
+        for key in [k for k, e in self._entries.items() if e["stored_at"] <= cutoff]:
+            del self._entries[key]
+            self.index.remove(key)
+        while len(self._entries) > self.max_entries:
+            key, _ = self._entries.popitem(last=False)
+            self.index.remove(key)
+
+    async def lookup(self, prompt):
+        """Return (outcome, entry, vector) for prompt
+
+        outcome is "reuse", "adapt", "miss" or "error". entry holds the cached
+        prompt, similarity and stage outputs on a hit. vector is the prompt's
+        embedding, for store(), or None if embedding failed.
+        """
+        start = time.perf_counter()
+        try:
+            vector = _normalize(await self.embed(prompt))
+        except Exception as e:
+            print(f"Semantic cache lookup failed: {e}")
+            self._count("error")
+            return "error", None, None
+        self._expire()
+        match = self.index.nearest(vector)
+        outcome, entry = "miss", None
+        if match is not None:
+            similarity, key = match
+            SEMANTIC_SIMILARITY.observe(similarity)
+            if similarity >= self.adapt_threshold:
+                outcome = "reuse" if similarity >= self.reuse_threshold else "adapt"
+                self._entries.move_to_end(key)
+                entry = {**self._entries[key], "similarity": similarity}
+        seconds = time.perf_counter() - start
+        SEMANTIC_CACHE_LOOKUP_SECONDS.observe(seconds)
+        # Keep a bounded window of recent latencies for stats()
+        self.lookup_seconds = self.lookup_seconds[-999:] + [seconds]
+        self._count(outcome)
+        return outcome, entry, vector
+
+    def _count(self, outcome):
+        self.counts[outcome] += 1
+        SEMANTIC_CACHE.inc(outcome=outcome)
+
+    def store(self, prompt, vector, data):
+        """Cache the stage outputs (routing, research, text) for prompt"""
+        if vector is None:
+            return
+        key = self._next_key
+        self._next_key += 1
+        self._entries[key] = {
+            "prompt": prompt,
+            "stored_at": time.time(),
+            "data": data,
+        }
+        self.index.add(key, vector)
+        self._expire()
+
+    def stats(self):
+        """Hit rates and lookup latency, for tuning the thresholds"""
+        lookups = sum(self.counts.values())
+        hits = self.counts["reuse"] + self.counts["adapt"]
+        latencies = sorted(self.lookup_seconds)
+
+        def percentile(q):
+            if not latencies:
+                return 0.0
+            return 1000 * latencies[min(len(latencies) - 1, int(len(latencies) * q))]
+
+        return {
+            **self.counts,
+            "size": len(self._entries),
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "lookup_ms_p50": percentile(0.5),
+            "lookup_ms_p95": percentile(0.95),
+        }
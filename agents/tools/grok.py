@@ -1,15 +1,43 @@
 import os
 import re
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
+GROK_BASE_URL = os.getenv("GROK_BASE_URL", "https://api.x.ai/v1")
+GROK_MODEL = "grok-beta"
+GROK_TIMEOUT = float(os.getenv("GROK_TIMEOUT", "20"))
+GROK_MAX_RETRIES = int(os.getenv("GROK_MAX_RETRIES", "2"))
 
-def grok_x_search(query):
-    """Retrieve web search results for a given query using Grok."""
-    client = OpenAI(
-        api_key=os.getenv("GROK_API_KEY"),
-        base_url="https://api.x.ai/v1",
-    )
-    messages = [
+# Lazily created shared clients, see perplexity.py
+_client = None
+_async_client = None
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = OpenAI(
+            api_key=os.getenv("GROK_API_KEY"),
+            base_url=GROK_BASE_URL,
+            timeout=GROK_TIMEOUT,
+            max_retries=GROK_MAX_RETRIES,
+        )
+    return _client
+
+
+def _get_async_client():
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOpenAI(
+            api_key=os.getenv("GROK_API_KEY"),
+            base_url=GROK_BASE_URL,
+            timeout=GROK_TIMEOUT,
+            max_retries=GROK_MAX_RETRIES,
+        )
+    return _async_client
+
+
+def _build_messages(query):
+    return [
         {
             "role": "system",
             "content": "You are a helpful assistant with access to up-to-date information from the web. You can provide context on various topics, especially recent events and developments. Your task is to provide enough content so the user can craft an informative and engaging post based on the given query.",
@@ -17,14 +45,35 @@ def grok_x_search(query):
         {"role": "user", "content": query},
     ]
 
-    response = client.chat.completions.create(
-        model="grok-beta",
-        messages=messages,
-        stream=False,
-    )
 
+def _clean_response(response):
     # Remove citations using regex
     content = response.choices[0].message.content
     cleaned_content = re.sub(r"\[\d+\]", "", content)
     return cleaned_content.strip()
 
+
+def grok_x_search(query):
+    """Retrieve web search results for a given query using Grok."""
+    response = _get_client().chat.completions.create(
+        model=GROK_MODEL,
+        messages=_build_messages(query),
+        stream=False,
+    )
+    return _clean_response(response)
+
+
+async def grok_x_search_async(query, timeout=None, max_retries=None):
+    """Async variant of grok_x_search with optional per-call limits."""
+    client = _get_async_client()
+    if timeout is not None or max_retries is not None:
+        client = client.with_options(
+            timeout=GROK_TIMEOUT if timeout is None else timeout,
+            max_retries=GROK_MAX_RETRIES if max_retries is None else max_retries,
+        )
+    response = await client.chat.completions.create(
+        model=GROK_MODEL,
+        messages=_build_messages(query),
+        stream=False,
+    )
+    return _clean_response(response)
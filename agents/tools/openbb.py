@@ -1,28 +1,96 @@
 import os
-from openbb import obb
+import threading
+import time
 from dotenv import load_dotenv
 
+from ..news_index import NEWS_INDEX, NewsIngester, company_symbols
+
 # Load environment variables
 load_dotenv()
 
-# Initialize the OpenBB SDK
-pat = os.getenv("OPENBB_PAT")
-if not pat:
-    raise ValueError("OPENBB_PAT environment variable is not set")
+# The openbb package is slow to import and login goes over the network, so
+# both happen on first use (or in a background warm-up) instead of at import.
+_obb = None
+_obb_lock = threading.Lock()
+
+
+def warm_up():
+    """Import the OpenBB SDK and log in, returning seconds spent on each"""
+    global _obb
+    with _obb_lock:
+        if _obb is not None:
+            return {}
+
+        pat = os.getenv("OPENBB_PAT")
+        if not pat:
+            raise ValueError("OPENBB_PAT environment variable is not set")
+
+        start = time.perf_counter()
+        from openbb import obb
+
+        imported = time.perf_counter()
+        try:
+            obb.account.login(pat=pat)
+        except Exception as e:
+            raise Exception(f"Failed to login to OpenBB: {str(e)}")
+        _obb = obb
+        return {"import": imported - start, "login": time.perf_counter() - imported}
+
+
+def _get_obb():
+    """Return the logged in obb app, importing it on first use"""
+    if _obb is None:
+        warm_up()
+    return _obb
 
-try:
-    obb.account.login(pat=pat)
-except Exception as e:
-    raise Exception(f"Failed to login to OpenBB: {str(e)}")
 
 def openbb_news_search(query):
     """Retrieve news results for a given query using OpenBB's news world endpoint."""
 
+    # Answer from the ingested news when it's fresh and has enough matches
+    articles = NEWS_INDEX.search(query, limit=5)
+    if articles is not None:
+        return articles
+
     # Fetch news from the world endpoint
-    return obb.news.world(query=query, limit=5, provider="benzinga")
+    results = _get_obb().news.world(query=query, limit=5, provider="benzinga")
+    NEWS_INDEX.add(results)
+    return results
 
 def openbb_news_on_company_search(query):
     """Retrieve news results for a given query using OpenBB's company endpoint."""
 
-    # Fetch news from the company news endpoint
-    return obb.news.company(query=query, limit=5, provider="benzinga")
+    # Company names are looked up by ticker, like the ingester pulls them.
+    # Names that aren't known tickers are searched as world news instead
+    symbols, names = company_symbols(query)
+    results = []
+    if symbols:
+        articles = NEWS_INDEX.company(symbols, limit=5)
+        if articles is None:
+            # Fetch news from the company news endpoint
+            articles = _get_obb().news.company(
+                symbol=symbols, limit=5, provider="benzinga"
+            )
+            NEWS_INDEX.add(articles, symbols=symbols)
+        results.append(articles)
+    for name in names:
+        results.append(openbb_news_search(name))
+    if len(results) == 1:
+        return results[0]
+    return [
+        article
+        for result in results
+        for article in getattr(result, "results", result) or []
+    ]
+
+
+def create_news_ingester(**options):
+    """NewsIngester that pulls recent Benzinga news into the shared index"""
+
+    def fetch_world(limit):
+        return _get_obb().news.world(limit=limit, provider="benzinga")
+
+    def fetch_company(symbols, limit):
+        return _get_obb().news.company(symbol=symbols, limit=limit, provider="benzinga")
+
+    return NewsIngester(fetch_world, fetch_company, **options)
@@ -1,15 +1,46 @@
 import os
 import re
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
+PERPLEXITY_BASE_URL = os.getenv(
+    "PERPLEXITY_BASE_URL", "https://api.perplexity.ai"
+)
+PERPLEXITY_MODEL = "llama-3.1-sonar-small-128k-online"
+PERPLEXITY_TIMEOUT = float(os.getenv("PERPLEXITY_TIMEOUT", "20"))
+PERPLEXITY_MAX_RETRIES = int(os.getenv("PERPLEXITY_MAX_RETRIES", "2"))
 
-def perplexity_web_search(query):
-    """Retrieve web search results for a given query using Perplexity."""
-    client = OpenAI(
-        api_key=os.getenv("PERPLEXITY_API_KEY"),
-        base_url="https://api.perplexity.ai",
-    )
-    messages = [
+# Clients are created on first use (after .env is loaded) and then reused,
+# so every call shares the same keep-alive connection pool.
+_client = None
+_async_client = None
+
+
+def _get_client():
+    global _client
+    if _client is None:
+        _client = OpenAI(
+            api_key=os.getenv("PERPLEXITY_API_KEY"),
+            base_url=PERPLEXITY_BASE_URL,
+            timeout=PERPLEXITY_TIMEOUT,
+            max_retries=PERPLEXITY_MAX_RETRIES,
+        )
+    return _client
+
+
+def _get_async_client():
+    global _async_client
+    if _async_client is None:
+        _async_client = AsyncOpenAI(
+            api_key=os.getenv("PERPLEXITY_API_KEY"),
+            base_url=PERPLEXITY_BASE_URL,
+            timeout=PERPLEXITY_TIMEOUT,
+            max_retries=PERPLEXITY_MAX_RETRIES,
+        )
+    return _async_client
+
+
+def _build_messages(query):
+    return [
         {
             "role": "system",
             "content": "You are a helpful assistant with access to up-to-date information from the web. You can provide context on various topics, especially recent events and developments. Your task is to provide enough content so the user can craft an informative and engaging post based on the given query.",
@@ -17,13 +48,35 @@ def perplexity_web_search(query):
         {"role": "user", "content": query},
     ]
 
-    response = client.chat.completions.create(
-        model="llama-3.1-sonar-small-128k-online",
-        messages=messages,
-        stream=False,
-    )
 
+def _clean_response(response):
     # Remove citations using regex
     content = response.choices[0].message.content
     cleaned_content = re.sub(r"\[\d+\]", "", content)
     return cleaned_content.strip()
+
+
+def perplexity_web_search(query):
+    """Retrieve web search results for a given query using Perplexity."""
+    response = _get_client().chat.completions.create(
+        model=PERPLEXITY_MODEL,
+        messages=_build_messages(query),
+        stream=False,
+    )
+    return _clean_response(response)
+
+
+async def perplexity_web_search_async(query, timeout=None, max_retries=None):
+    """Async variant of perplexity_web_search with optional per-call limits."""
+    client = _get_async_client()
+    if timeout is not None or max_retries is not None:
+        client = client.with_options(
+            timeout=PERPLEXITY_TIMEOUT if timeout is None else timeout,
+            max_retries=PERPLEXITY_MAX_RETRIES if max_retries is None else max_retries,
+        )
+    response = await client.chat.completions.create(
+        model=PERPLEXITY_MODEL,
+        messages=_build_messages(query),
+        stream=False,
+    )
+    return _clean_response(response)
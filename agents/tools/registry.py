@@ -0,0 +1,92 @@
+import asyncio
+import importlib
+import threading
+import time
+
+# Tool name -> (module, sync function, async function or None). Modules are
+# only imported when a tool is first used or warmed up.
+TOOLS = {
+    "perplexity_web_search": (
+        "perplexity",
+        "perplexity_web_search",
+        "perplexity_web_search_async",
+    ),
+    "grok_x_search": ("grok", "grok_x_search", "grok_x_search_async"),
+    "openbb_news_search": ("openbb", "openbb_news_search", None),
+    "openbb_news_on_company_search": ("openbb", "openbb_news_on_company_search", None),
+}
+
+
+class ToolRegistry:
+    """Imports research tools on first use and records how long that took.
+
+    Modules may define warm_up() to authenticate ahead of time; it may return
+    a dict of named timings (e.g. import and login) which end up in timings.
+    """
+
+    def __init__(self, tools=None):
+        self.tools = tools or TOOLS
+        self.timings = {}
+        self._modules = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, name):
+        return name in self.tools
+
+    def _module(self, module_name):
+        with self._lock:
+            if module_name not in self._modules:
+                start = time.perf_counter()
+                module = importlib.import_module(f".{module_name}", __package__)
+                self.timings[f"{module_name}.import"] = time.perf_counter() - start
+                self._modules[module_name] = module
+            return self._modules[module_name]
+
+    def get(self, name):
+        """Return (sync function, async function or None) for a tool"""
+        module_name, sync_name, async_name = self.tools[name]
+        # Imported modules skip the lock, a warm-up may hold it for seconds
+        module = self._modules.get(module_name) or self._module(module_name)
+        async_function = getattr(module, async_name) if async_name else None
+        return getattr(module, sync_name), async_function
+
+    async def resolve(self, name):
+        """get() for the event loop, a first import runs in a worker thread
+
+        Importing can take seconds, and may wait on the lock held by a
+        warm-up thread, neither of which may block the loop.
+        """
+        module_name = self.tools[name][0]
+        if module_name in self._modules:
+            return self.get(name)
+        return await asyncio.to_thread(self.get, name)
+
+    def _warm_up_module(self, module_name):
+        module = self._module(module_name)
+        warm_up = getattr(module, "warm_up", None)
+        if warm_up is None:
+            return
+        start = time.perf_counter()
+        for step, seconds in (warm_up() or {}).items():
+            self.timings[f"{module_name}.{step}"] = seconds
+        self.timings[f"{module_name}.warm_up"] = time.perf_counter() - start
+
+    async def warm_up(self):
+        """Import and authenticate every tool module in background threads
+
+        Failures are returned instead of raised so one broken tool (e.g. a
+        missing OpenBB PAT) doesn't take the others down.
+        """
+        module_names = sorted({module for module, _, _ in self.tools.values()})
+        results = await asyncio.gather(
+            *(
+                asyncio.to_thread(self._warm_up_module, module_name)
+                for module_name in module_names
+            ),
+            return_exceptions=True,
+        )
+        return {
+            module_name: result
+            for module_name, result in zip(module_names, results)
+            if isinstance(result, Exception)
+        }
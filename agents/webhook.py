@@ -0,0 +1,78 @@
+import asyncio
+import hmac
+import logging
+import signal
+
+from aiohttp import web
+from telegram import Update
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+def create_webhook_app(application, path, secret_token=None):
+    """aiohttp app that feeds Telegram webhook updates into application
+
+    Requests must carry secret_token in Telegram's secret header when one is
+    configured. Updates go straight onto the application's update queue.
+    """
+
+    async def receive(request):
+        if secret_token and not hmac.compare_digest(
+            request.headers.get(SECRET_HEADER, ""), secret_token
+        ):
+            return web.Response(status=403)
+        try:
+            update = Update.de_json(await request.json(), application.bot)
+        except Exception as e:
+            logger.warning("Rejected malformed webhook update: %s", str(e))
+            return web.Response(status=400)
+        await application.update_queue.put(update)
+        return web.Response()
+
+    app = web.Application()
+    app.router.add_post(path, receive)
+    return app
+
+
+async def run_webhook(
+    application, listen, port, path, secret_token=None, webhook_url=None
+):
+    """Run application behind an embedded webhook server until interrupted
+
+    If webhook_url is given it is registered with Telegram on startup, otherwise
+    the webhook is expected to be configured already (e.g. behind a proxy).
+    """
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    runner = web.AppRunner(create_webhook_app(application, path, secret_token))
+    # Same lifecycle and hook order as Application.run_polling/run_webhook
+    await application.initialize()
+    try:
+        if application.post_init:
+            await application.post_init(application)
+        if webhook_url:
+            await application.bot.set_webhook(
+                url=webhook_url,
+                secret_token=secret_token,
+                allowed_updates=Update.ALL_TYPES,
+            )
+        await application.start()
+        await runner.setup()
+        await web.TCPSite(runner, listen, port).start()
+        logger.info("Listening for Telegram webhooks on %s:%d%s", listen, port, path)
+
+        await stop.wait()
+    finally:
+        await runner.cleanup()
+        if application.running:
+            await application.stop()
+            if application.post_stop:
+                await application.post_stop(application)
+        await application.shutdown()
+        if application.post_shutdown:
+            await application.post_shutdown(application)
@@ -1,10 +1,11 @@
-from atproto import Client, client_utils
 import os
+import time
 import asyncio
 from dotenv import load_dotenv
 import logging
 import argparse
-from telegram import Update
+from telegram import Update, Message
+from telegram.error import TelegramError
 from telegram.ext import (
     Application,
     CommandHandler,
@@ -13,6 +14,23 @@ from telegram.ext import (
     ContextTypes,
 )
 from agents.llama_3_2_ollama import LanguageModelWrapper
+from agents.scheduler import FairScheduler, QueueFullError
+from agents.bluesky import BlueskyPublisher
+from agents.webhook import run_webhook
+from agents.batch import read_topics, run_batch
+from agents.jobs import JOB_STORE_PATH, JobStore
+from agents.news_index import NEWS_INDEX, NEWS_INGEST_ENABLED
+from agents.tools.openbb import create_news_ingester
+from agents.metrics import (
+    ACTIVE_GENERATIONS,
+    MESSAGES,
+    QUEUE_DEPTH,
+    STAGE_SECONDS,
+    TIMEOUTS,
+    format_spans,
+    stage_span,
+    start_metrics_server,
+)
 
 # Initialize logger
 logger = logging.getLogger(__name__)
@@ -20,20 +38,6 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
-BLUESKY_HANDLE = os.getenv("BLUESKY_HANDLE")
-BLUESKY_PASSWORD = os.getenv("BLUESKY_PASSWORD")
-TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
-
-if not all(
-    [
-        BLUESKY_HANDLE,
-        BLUESKY_PASSWORD,
-        TELEGRAM_BOT_TOKEN,
-    ]
-):
-    raise ValueError("Missing environment variables. Please check .env file.")
-
-
 try:
     # Initialize the generator once
     language_model_wrapper = LanguageModelWrapper()
@@ -43,12 +47,70 @@ except Exception as e:
     raise RuntimeError("Model initialization failed") from e
 
 
-# Initialize Bluesky client
-bluesky_client = Client()
+# Limit concurrent generations against the local Ollama instance and queue
+# the rest fairly between users
+scheduler = FairScheduler(
+    max_concurrency=int(os.getenv("MAX_CONCURRENT_GENERATIONS", "1")),
+    max_queue=int(os.getenv("MAX_QUEUED_MESSAGES", "20")),
+    max_per_user=int(os.getenv("MAX_QUEUED_MESSAGES_PER_USER", "3")),
+)
+QUEUE_DEPTH.set_function(lambda: scheduler.queued)
+ACTIVE_GENERATIONS.set_function(lambda: scheduler.active)
+
+
+# Set up by setup_bot() for the Telegram bot, batch mode only needs a
+# publisher and only when it posts
+bluesky_publisher = None
+job_store = None
+
+# Keeps recent news in memory so the OpenBB tools rarely fetch on the request path
+news_ingester = create_news_ingester() if NEWS_INGEST_ENABLED else None
+# Updates being processed right now by this process
+active_jobs = set()
+
+# Minimum seconds between Telegram edits while a post is streaming in
+STREAM_EDIT_INTERVAL = 1.0
+
+# Seconds a single generation may take before it is cancelled, which aborts
+# its in-flight Ollama and research requests and frees the generation slot
+GENERATION_TIMEOUT = float(os.getenv("GENERATION_TIMEOUT", "30"))
+
+
+def require_env(*names: str) -> None:
+    """Raise if any of the given environment variables is missing."""
+    missing = [name for name in names if not os.getenv(name)]
+    if missing:
+        raise ValueError(
+            f"Missing environment variables {', '.join(missing)}. "
+            "Please check .env file."
+        )
+
+
+def create_publisher() -> BlueskyPublisher:
+    """Bluesky publisher from the environment, logging in once per session."""
+    require_env("BLUESKY_HANDLE", "BLUESKY_PASSWORD")
+    return BlueskyPublisher(
+        os.getenv("BLUESKY_HANDLE"),
+        os.getenv("BLUESKY_PASSWORD"),
+        session_path=os.getenv("BLUESKY_SESSION_PATH"),
+        base_url=os.getenv("BLUESKY_XRPC_URL"),
+    )
+
+
+def setup_bot() -> None:
+    """Create the publisher and job store the Telegram bot runs on."""
+    global bluesky_publisher, job_store
+    require_env("TELEGRAM_BOT_TOKEN", "BLUESKY_HANDLE", "BLUESKY_PASSWORD")
+    bluesky_publisher = create_publisher()
+    # Every update and its progress, so redeliveries and restarts don't redo work
+    job_store = JobStore(JOB_STORE_PATH)
 
-profile = bluesky_client.login(BLUESKY_HANDLE, BLUESKY_PASSWORD)
 
-logger.info("Logged in to Bluesky as %s", profile.display_name)
+def split_post(output: str) -> list:
+    """Split a generated post into Bluesky-sized thread chunks."""
+    # Split long messages into chunks of 300 characters
+    chunks = [output[i:i + 300] for i in range(0, len(output), 300)]
+    return [chunk.strip("\"'") for chunk in chunks]
 
 
 async def start(update: Update, _context: ContextTypes.DEFAULT_TYPE) -> None:
@@ -60,27 +122,103 @@ async def start(update: Update, _context: ContextTypes.DEFAULT_TYPE) -> None:
     )
 
 
+def progress_updater(message: Message, interval: float = STREAM_EDIT_INTERVAL):
+    """Return a callback that edits message with partial text, throttled."""
+    last_edit = 0.0
+    last_text = ""
+
+    async def on_text(text: str) -> None:
+        nonlocal last_edit, last_text
+        now = time.monotonic()
+        if now - last_edit < interval or not text or text == last_text:
+            return
+        last_edit, last_text = now, text
+        try:
+            await message.edit_text(f"✍️ {text}")
+        except TelegramError as e:
+            logger.warning("Failed to update progress message: %s", str(e))
+
+    return on_text
+
+
 async def handle_message(
-    update: Update, _context: ContextTypes.DEFAULT_TYPE
+    update: Update, context: ContextTypes.DEFAULT_TYPE
 ) -> None:
     """Post the user message to Bluesky."""
     prompt = update.message.text
     user = update.effective_user
 
-    # Send a temporary message to indicate processing
-    processing_message = await update.message.reply_text(
-        "Generating response..."
+    # Telegram may deliver the same update twice, only ever process it once
+    job, created = job_store.create(
+        update.update_id, user.id, user.username, update.effective_chat.id, prompt
     )
+    # Claim the job before the first await so a redelivery arriving meanwhile
+    # sees it as taken
+    if (not created and job["status"] == "done") or not claim_job(update.update_id):
+        logger.info("Ignoring duplicate update %d", update.update_id)
+        return
 
     try:
-        # Run the model generation in a separate thread with a timeout
-        result = await asyncio.wait_for(
-            asyncio.get_event_loop().run_in_executor(
-                None,
-                lambda: language_model_wrapper.generate_response(prompt)
-            ),
-            timeout=30.0,  # 30 second timeout
+        # Send a temporary message to indicate processing
+        processing_message = await update.message.reply_text(
+            "Generating response..."
         )
+    except BaseException:
+        active_jobs.discard(update.update_id)
+        raise
+    await process_job(job, processing_message, context.bot_data.get("stream", False))
+
+
+def claim_job(update_id: int) -> bool:
+    """Mark a job as being processed here, False if it already is."""
+    if update_id in active_jobs:
+        return False
+    active_jobs.add(update_id)
+    return True
+
+
+async def process_job(job: dict, processing_message: Message, stream: bool) -> None:
+    """Run a claimed job through generation and publishing, from checkpoints."""
+    update_id = job["update_id"]
+    prompt = job["prompt"]
+    username = job["username"]
+    received_at = time.perf_counter()
+
+    # Seconds this message spent in each stage, logged once it's handled
+    spans = {}
+
+    def checkpoint(stage: str, data: dict) -> None:
+        job_store.checkpoint(update_id, stage, data)
+
+    def checkpoint_thread(thread: dict) -> None:
+        checkpoint("publishing", {"thread": thread})
+
+    try:
+        async def on_queued(position: int) -> None:
+            # Only a courtesy, the job must not fail over it
+            try:
+                await processing_message.edit_text(
+                    f"Queued, you're #{position} in line. Generating response soon..."
+                )
+            except TelegramError as e:
+                logger.warning("Failed to update queue position: %s", str(e))
+
+        async def generate() -> dict:
+            spans["queue"] = time.perf_counter() - received_at
+            STAGE_SECONDS.observe(spans["queue"], stage="queue")
+            return await asyncio.wait_for(
+                language_model_wrapper.generate_response(
+                    prompt,
+                    stream=stream,
+                    on_text=progress_updater(processing_message) if stream else None,
+                    checkpoint=job["data"],
+                    on_checkpoint=checkpoint,
+                ),
+                timeout=GENERATION_TIMEOUT,
+            )
+
+        # Wait for a generation slot, the timeout only covers generation
+        result = await scheduler.run(job["user_id"], generate, on_queued=on_queued)
         
         # Check if result is None or missing required fields
         if not result or 'text' not in result:
@@ -92,30 +230,34 @@ async def handle_message(
                 f"🔍 Researching topic using {result['tool_used']}"
             )
 
-        # Split long messages into chunks of 300 characters
-        chunks = [output[i:i + 300] for i in range(0, len(output), 300)]
-
-        # Post the first chunk
-        text = client_utils.TextBuilder().text(chunks[0].strip("\"'"))
-        parent_post = bluesky_client.send_post(text)
-        last_post = parent_post
-
-        # Create thread for remaining chunks if any
-        for chunk in chunks[1:]:
-            text = client_utils.TextBuilder().text(chunk.strip("\"'"))
-            last_post = bluesky_client.send_post(
-                text,
-                reply_to={
-                    "parent": {"uri": last_post.uri, "cid": last_post.cid},
-                    "root": {"uri": parent_post.uri, "cid": parent_post.cid},
-                },
+        chunks = split_post(output)
+
+        # Post the chunks as a thread without blocking other updates. The
+        # thread state is saved as it goes so a restart never posts it twice
+        spans.update(result.get("spans", {}))
+        with stage_span(spans, "publish"):
+            posts = await bluesky_publisher.send_thread(
+                chunks,
+                checkpoint=job["data"].get("thread"),
+                on_checkpoint=checkpoint_thread,
             )
 
         # Get URL of the first post in the thread
-        post_uri = parent_post.uri.split("/")[-1]
-        post_url = f"https://bsky.app/profile/{BLUESKY_HANDLE}/post/{post_uri}"
+        post_url = bluesky_publisher.post_url(posts[0])
+        checkpoint("posted", {"post_url": post_url})
+        job_store.finish(update_id, "done")
         logger.info("Posted to Bluesky: %s", post_url)
-        print("Message from @%s: %s", user.username, output)
+        logger.info("Message from @%s: %s", username, output)
+
+        elapsed = time.perf_counter() - received_at
+        STAGE_SECONDS.observe(elapsed, stage="total")
+        MESSAGES.inc(outcome="posted")
+        logger.info(
+            "Handled message from @%s in %.2fs (%s)",
+            username,
+            elapsed,
+            format_spans(spans),
+        )
 
         # Update the processing message
         thread_info = " (threaded)" if len(chunks) > 1 else ""
@@ -124,18 +266,56 @@ async def handle_message(
             f"{research_info}Your message has been posted to Bluesky{thread_info}: {post_url}"
         )
 
+    except QueueFullError as e:
+        MESSAGES.inc(outcome="rejected")
+        job_store.finish(update_id, "failed", str(e))
+        await processing_message.edit_text(f"Sorry, I'm busy right now. {str(e)}")
+        logger.warning(
+            "Rejected message from @%s, %d queued", username, scheduler.queued
+        )
+
     except asyncio.TimeoutError:
+        MESSAGES.inc(outcome="timeout")
+        TIMEOUTS.inc(operation="generation")
+        job_store.finish(update_id, "failed", "generation timed out")
         await processing_message.edit_text(
             "Sorry, the generation is taking too long. Please try again."
         )
         logger.error("Generation timed out for prompt: %s", prompt)
 
     except Exception as e:
+        MESSAGES.inc(outcome="error")
+        job_store.finish(update_id, "failed", str(e))
         await processing_message.edit_text(
             f"Sorry, something went wrong while processing your message. {str(e)}"
         )
         logger.error("Error processing message: %s", str(e), exc_info=True)
 
+    finally:
+        active_jobs.discard(update_id)
+
+
+async def resume_jobs(app: Application) -> None:
+    """Finish the jobs a previous run was still working on when it stopped."""
+    for job in job_store.unfinished():
+        if not claim_job(job["update_id"]):
+            continue
+        logger.info(
+            "Resuming update %d from stage %s", job["update_id"], job["stage"]
+        )
+        try:
+            processing_message = await app.bot.send_message(
+                job["chat_id"], "Picking up your post where I left off..."
+            )
+        except TelegramError as e:
+            logger.warning("Can't resume update %d: %s", job["update_id"], str(e))
+            job_store.finish(job["update_id"], "failed", str(e))
+            active_jobs.discard(job["update_id"])
+            continue
+        app.create_task(
+            process_job(job, processing_message, app.bot_data.get("stream", False))
+        )
+
 
 async def error_handler(
     _update: object, context: ContextTypes.DEFAULT_TYPE
@@ -144,6 +324,134 @@ async def error_handler(
     logger.error("Exception while handling an update:", exc_info=context.error)
 
 
+async def warm_up() -> None:
+    """Log in to Bluesky, load the model and tools without delaying startup."""
+
+    async def login() -> None:
+        profile = await bluesky_publisher.login()
+        logger.info("Logged in to Bluesky as %s", profile.display_name)
+
+    async def warm_up_tools() -> None:
+        for tool, error in (await language_model_wrapper.warm_up_tools()).items():
+            logger.warning("Tool %s unavailable: %s", tool, str(error))
+        logger.info("Tool load times: %s", language_model_wrapper.tools.timings)
+
+    steps = {
+        "Bluesky login": login(),
+        "Model warm-up": language_model_wrapper.warm_up(),
+        "Tool warm-up": warm_up_tools(),
+    }
+    results = await asyncio.gather(*steps.values(), return_exceptions=True)
+    for step, result in zip(steps, results):
+        if isinstance(result, Exception):
+            logger.warning("%s failed: %s", step, str(result))
+
+
+async def post_init(app: Application) -> None:
+    """Start warming up in the background so the bot answers right away."""
+    app.create_task(warm_up())
+    app.create_task(resume_jobs(app))
+    if news_ingester is not None:
+        news_ingester.start()
+
+    metrics_port = app.bot_data.get("metrics_port")
+    if metrics_port:
+        app.bot_data["metrics_runner"] = await start_metrics_server(
+            "127.0.0.1", metrics_port
+        )
+        logger.info("Serving metrics on http://127.0.0.1:%d/metrics", metrics_port)
+
+
+async def shutdown(app: Application) -> None:
+    """Release the language model's HTTP connections, tool cache and metrics."""
+    logger.info("Tool cache stats: %s", language_model_wrapper.tool_cache.stats())
+    logger.info(
+        "Prompt eval stats: %s", language_model_wrapper.prompt_eval_report()
+    )
+    logger.info(
+        "Research compaction stats: %s", language_model_wrapper.compaction_report()
+    )
+    if language_model_wrapper.semantic_cache is not None:
+        logger.info(
+            "Semantic cache stats: %s", language_model_wrapper.semantic_cache.stats()
+        )
+    if language_model_wrapper.speculative:
+        logger.info(
+            "Speculative draft stats: %s", language_model_wrapper.speculation_report()
+        )
+    logger.info("Tool hedging stats: %s", language_model_wrapper.hedger.stats())
+    if language_model_wrapper.route_batcher is not None:
+        logger.info(
+            "Routing batch stats: %s", language_model_wrapper.route_batcher.stats()
+        )
+    if news_ingester is not None:
+        await news_ingester.stop()
+        logger.info("News index stats: %s", NEWS_INDEX.stats())
+    await language_model_wrapper.close()
+    job_store.close()
+    if "metrics_runner" in app.bot_data:
+        await app.bot_data["metrics_runner"].cleanup()
+
+
+async def process_topic(topic: str, publisher: BlueskyPublisher = None) -> dict:
+    """Research, write and (given a publisher) publish one batch topic."""
+    result = await asyncio.wait_for(
+        language_model_wrapper.generate_response(topic),
+        timeout=GENERATION_TIMEOUT,
+    )
+    if not result or "text" not in result:
+        raise ValueError("Invalid response from language model")
+    chunks = split_post(result["text"])
+    record = {"text": result["text"], "tool_used": result["tool_used"]}
+    record["thread"] = chunks
+    if publisher is not None:
+        with STAGE_SECONDS.time(stage="publish"):
+            posts = await publisher.send_thread(chunks)
+        record["post_url"] = publisher.post_url(posts[0])
+    return record
+
+
+async def run_batch_mode(
+    input_path: str, output_path: str, concurrency: int, dry_run: bool
+) -> None:
+    """Process every topic in input_path and write results to output_path.
+
+    Needs Bluesky credentials unless dry_run, never the Telegram token.
+    """
+    publisher = None
+    if not dry_run:
+        publisher = create_publisher()
+        # Fail before generating anything if posting is going to fail anyway
+        await publisher.login()
+    await asyncio.gather(
+        language_model_wrapper.warm_up(),
+        language_model_wrapper.warm_up_tools(),
+        return_exceptions=True,
+    )
+
+    if news_ingester is not None:
+        news_ingester.start()
+    start = time.perf_counter()
+    try:
+        succeeded, failed = await run_batch(
+            read_topics(input_path),
+            lambda topic: process_topic(topic, publisher),
+            output_path,
+            concurrency=concurrency,
+        )
+    finally:
+        if news_ingester is not None:
+            await news_ingester.stop()
+        await language_model_wrapper.close()
+    logger.warning(
+        "Batch finished in %.1fs: %d succeeded, %d failed, results in %s",
+        time.perf_counter() - start,
+        succeeded,
+        failed,
+        output_path,
+    )
+
+
 def setup_logging(verbose: bool) -> None:
     level = logging.INFO if verbose else logging.WARNING
     logging.basicConfig(
@@ -152,19 +460,23 @@ def setup_logging(verbose: bool) -> None:
     )
 
 
-def main():
-    parser = argparse.ArgumentParser()
-    parser.add_argument(
-        "--verbose", action="store_true", help="Enable verbose logging"
+def build_application(stream: bool = False, metrics_port: int = 0) -> Application:
+    """Create the Telegram application with all handlers registered."""
+    builder = (
+        Application.builder()
+        .token(os.getenv("TELEGRAM_BOT_TOKEN"))
+        # Handle updates concurrently, the scheduler bounds generation
+        .concurrent_updates(True)
+        .post_init(post_init)
+        .post_shutdown(shutdown)
     )
-    args = parser.parse_args()
-
-    setup_logging(args.verbose)
-
-    logger.info("Starting Bluesky-Telegram bot...")
+    # Self-hosted Bot API servers (and local fakes) live at a different URL
+    if os.getenv("TELEGRAM_BASE_URL"):
+        builder = builder.base_url(os.getenv("TELEGRAM_BASE_URL"))
+    app = builder.build()
 
-    # Create Telegram application
-    app = Application.builder().token(TELEGRAM_BOT_TOKEN).build()
+    app.bot_data["stream"] = stream
+    app.bot_data["metrics_port"] = metrics_port
 
     # Add handlers
     app.add_handler(CommandHandler("start", start))
@@ -174,9 +486,104 @@ def main():
 
     # Register error handler
     app.add_error_handler(error_handler)
+    return app
+
 
-    # Start polling
-    app.run_polling(poll_interval=1.0)
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--verbose", action="store_true", help="Enable verbose logging"
+    )
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream the generated post into the Telegram reply as it is written",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=int(os.getenv("METRICS_PORT", "0")),
+        help="Serve Prometheus metrics on this local port (0 disables it)",
+    )
+    parser.add_argument(
+        "--webhook",
+        action="store_true",
+        help="Receive updates through a webhook server instead of long polling",
+    )
+    parser.add_argument(
+        "--webhook-listen",
+        default=os.getenv("WEBHOOK_LISTEN", "127.0.0.1"),
+        help="Address the webhook server binds to",
+    )
+    parser.add_argument(
+        "--webhook-port",
+        type=int,
+        default=int(os.getenv("WEBHOOK_PORT", "8443")),
+        help="Port the webhook server listens on",
+    )
+    parser.add_argument(
+        "--webhook-path",
+        default=os.getenv("WEBHOOK_PATH", "/telegram"),
+        help="URL path Telegram posts updates to",
+    )
+    parser.add_argument(
+        "--webhook-url",
+        default=os.getenv("WEBHOOK_URL"),
+        help="Public URL to register with Telegram, skip if already configured",
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="INPUT_JSONL",
+        help="Generate posts for every topic in a JSONL file instead of running the bot",
+    )
+    parser.add_argument(
+        "--output",
+        default="batch_results.jsonl",
+        help="Where --batch writes one JSON result per topic",
+    )
+    parser.add_argument(
+        "--batch-concurrency",
+        type=int,
+        default=int(os.getenv("BATCH_CONCURRENCY", "4")),
+        help="Topics processed at once in --batch mode",
+    )
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="With --batch, write drafts without posting them to Bluesky",
+    )
+    args = parser.parse_args()
+
+    setup_logging(args.verbose)
+
+    if args.batch:
+        asyncio.run(
+            run_batch_mode(
+                args.batch, args.output, args.batch_concurrency, args.dry_run
+            )
+        )
+        return
+
+    logger.info("Starting Bluesky-Telegram bot...")
+    setup_bot()
+
+    # Create Telegram application
+    app = build_application(stream=args.stream, metrics_port=args.metrics_port)
+
+    if args.webhook:
+        asyncio.run(
+            run_webhook(
+                app,
+                listen=args.webhook_listen,
+                port=args.webhook_port,
+                path=args.webhook_path,
+                secret_token=os.getenv("TELEGRAM_WEBHOOK_SECRET"),
+                webhook_url=args.webhook_url,
+            )
+        )
+    else:
+        # Start polling
+        app.run_polling(poll_interval=1.0)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,263 @@
+import argparse
+import asyncio
+import importlib.util
+import itertools
+import json
+import os
+import statistics
+import sys
+import time
+
+from fakes import FakeServices, FakeTelegramSender
+
+# Run from anywhere, the agents package and bot script live one level up
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# A mix that exercises local routing, LLM routing and every tool
+PROMPTS = [
+    "NVDA earnings",
+    "$AAPL services revenue",
+    "what people are saying on twitter about open source models",
+    "latest news on rate cuts",
+    "open source is eating finance",
+    "why every analyst needs a research copilot",
+    "what is retrieval augmented generation",
+    "tesla deliveries this quarter",
+]
+
+
+def load_bot(environment):
+    """Import bluesky-agent.py as a module with the given environment"""
+    os.environ.update(environment)
+    spec = importlib.util.spec_from_file_location(
+        "bluesky_agent", os.path.join(REPO_ROOT, "bluesky-agent.py")
+    )
+    bot = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(bot)
+    return bot
+
+
+def build_update(update_id, user_id, text, chat_id=None):
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": chat_id or user_id, "type": "private"},
+            "from": {
+                "id": user_id,
+                "is_bot": False,
+                "first_name": "Bench",
+                "username": f"bench{user_id}",
+            },
+            "text": text,
+        },
+    }
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    return statistics.quantiles(values, n=100, method="inclusive")[q - 1]
+
+
+async def run(args):
+    fakes = await FakeServices(
+        token_latency=args.token_latency,
+        tokens=args.tokens,
+        tool_latency=args.tool_latency,
+        tool_slow_rate=args.tool_slow_rate,
+        bluesky_latency=args.bluesky_latency,
+        ollama_hosts=args.ollama_hosts,
+        ollama_error_rate=args.ollama_error_rate,
+    ).start()
+    if args.ollama_outage:
+        # The first host is down for the start of the run, then comes back
+        outage_host = fakes.ollamas[0]
+        outage_host.down = True
+        asyncio.get_running_loop().call_later(
+            args.ollama_outage, setattr, outage_host, "down", False
+        )
+    # Update ids restart at 1 every run, keep jobs from leaking between runs
+    environment = {**fakes.environment(), "JOB_STORE_PATH": ":memory:"}
+    bot = load_bot({**environment, **dict(args.env)})
+    bot.setup_bot()
+    from agents.backends import BackendPool
+    from agents.metrics import BACKEND_FAILOVERS
+
+    # OpenBB has no HTTP endpoint to point at, hand the tool a stand-in instead
+    import agents.tools.openbb as openbb_tool
+
+    openbb_tool._obb = fakes.openbb
+
+    from telegram import Update
+    from telegram.ext import Application, CallbackContext
+
+    if args.webhook:
+        from agents.webhook import create_webhook_app
+        from aiohttp import web
+
+        # The real application, fed over HTTP like Telegram would
+        app = bot.build_application(stream=args.stream)
+        runner = web.AppRunner(create_webhook_app(app, "/telegram", "bench"))
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        sender = FakeTelegramSender(f"http://127.0.0.1:{port}/telegram", "bench")
+    else:
+        app = (
+            Application.builder()
+            .token(fakes.telegram.token)
+            .base_url(f"{fakes.url}/bot")
+            .build()
+        )
+        app.bot_data["stream"] = args.stream
+    await app.initialize()
+    if args.webhook:
+        await app.start()
+    await bot.bluesky_publisher.login()
+    if bot.news_ingester is not None:
+        # Measure the steady state, with news already indexed
+        await asyncio.to_thread(bot.news_ingester.ingest)
+        bot.news_ingester.start()
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    latencies = []
+    prompts = itertools.cycle(PROMPTS)
+
+    async def send(update_id):
+        async with semaphore:
+            # In webhook mode use one chat per update so each final reply can
+            # be told apart
+            data = build_update(
+                update_id,
+                update_id % args.users + 1,
+                next(prompts),
+                chat_id=update_id if args.webhook else None,
+            )
+            start = time.perf_counter()
+            if args.webhook:
+                await sender.send(data)
+                finished = await fakes.telegram.wait_finished(update_id)
+                latencies.append(finished - start)
+                return
+            update = Update.de_json(data, app.bot)
+            await bot.handle_message(update, CallbackContext.from_update(update, app))
+            latencies.append(time.perf_counter() - start)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(i) for i in range(1, args.messages + 1)))
+    elapsed = time.perf_counter() - started
+
+    posted = sum("posted to Bluesky" in t for t in fakes.telegram.texts.values())
+    wrapper = bot.language_model_wrapper
+    speculation = wrapper.speculation_report() if wrapper.speculative else None
+    semantic_cache = wrapper.semantic_cache and wrapper.semantic_cache.stats()
+    hedging = wrapper.hedger.stats()
+    routing_batches = wrapper.route_batcher and wrapper.route_batcher.stats()
+    # Health as last checked, a host back from an outage shows up healthy
+    backend_healthy = None
+    if isinstance(wrapper.backend, BackendPool):
+        backend_healthy = [wrapper.backend.healthy[b] for b in wrapper.backend.backends]
+    news_index = None
+    if bot.news_ingester is not None:
+        await bot.news_ingester.stop()
+        news_index = bot.NEWS_INDEX.stats()
+    if args.webhook:
+        await sender.close()
+        await runner.cleanup()
+        await app.stop()
+    await app.shutdown()
+    await bot.language_model_wrapper.close()
+    await fakes.stop()
+
+    return {
+        "messages": args.messages,
+        "concurrency": args.concurrency,
+        "posted": posted,
+        "elapsed_s": elapsed,
+        "messages_per_s": args.messages / elapsed,
+        "p50_s": percentile(latencies, 50),
+        "p95_s": percentile(latencies, 95),
+        "p99_s": percentile(latencies, 99),
+        "ollama_requests": sum(ollama.requests for ollama in fakes.ollamas),
+        "ollama_requests_per_host": [ollama.requests for ollama in fakes.ollamas],
+        "ollama_aborted": sum(ollama.aborted for ollama in fakes.ollamas),
+        "ollama_errors_per_host": [ollama.errors for ollama in fakes.ollamas],
+        "backend_failovers": BACKEND_FAILOVERS.total(),
+        "backend_healthy": backend_healthy,
+        "speculation": speculation,
+        "semantic_cache": semantic_cache,
+        "hedging": hedging,
+        "routing_batches": routing_batches,
+        "news_index": news_index,
+    }
+
+
+def parse_env(value):
+    key, _, val = value.partition("=")
+    return key, val
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Drive handle_message end to end against local fakes"
+    )
+    parser.add_argument("--messages", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--users", type=int, default=5)
+    parser.add_argument("--tokens", type=int, default=40)
+    parser.add_argument("--token-latency", type=float, default=0.01)
+    parser.add_argument("--tool-latency", type=float, default=0.5)
+    parser.add_argument(
+        "--tool-slow-rate",
+        type=float,
+        default=0.0,
+        help="Share of tool calls that take 10x --tool-latency",
+    )
+    parser.add_argument("--bluesky-latency", type=float, default=0.05)
+    parser.add_argument(
+        "--ollama-hosts",
+        type=int,
+        default=1,
+        help="Fake Ollama hosts to balance generations across",
+    )
+    parser.add_argument(
+        "--ollama-error-rate",
+        type=float,
+        default=0.0,
+        help="Share of generations each fake Ollama host answers with a 503",
+    )
+    parser.add_argument(
+        "--ollama-outage",
+        type=float,
+        default=0.0,
+        help="Seconds the first Ollama host is down for at the start of the run, "
+        "use with --ollama-hosts 2+ and a short BACKEND_HEALTH_INTERVAL",
+    )
+    parser.add_argument("--stream", action="store_true")
+    parser.add_argument(
+        "--webhook",
+        action="store_true",
+        help="Deliver updates over HTTP to the webhook server instead of calling "
+        "handle_message directly",
+    )
+    parser.add_argument(
+        "--env",
+        type=parse_env,
+        action="append",
+        default=[],
+        help="Extra KEY=VALUE settings for the bot, e.g. MAX_CONCURRENT_GENERATIONS=4",
+    )
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(results))
+    else:
+        for key, value in results.items():
+            value = f"{value:.3f}" if isinstance(value, float) else value
+            print(f"{key:<18} {value}")
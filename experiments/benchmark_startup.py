@@ -0,0 +1,86 @@
+import asyncio
+import os
+import subprocess
+import sys
+import time
+from dotenv import load_dotenv
+
+# Run from anywhere, the agents package lives one level up
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# Imports bluesky-agent.py pays for, directly or on first tool use
+IMPORTS = [
+    "telegram.ext",
+    "atproto",
+    "openai",
+    "openbb",
+    "agents.llama_3_2_ollama",
+    "agents.bluesky",
+    "agents.tools.perplexity",
+    "agents.tools.grok",
+    "agents.tools.openbb",
+]
+
+
+def time_import(module):
+    """Time an import in a fresh interpreter so shared dependencies don't hide costs."""
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {module}; print(time.perf_counter() - start)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=REPO_ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return None
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+async def time_step(coroutine):
+    start = time.perf_counter()
+    try:
+        await coroutine
+    except Exception as e:
+        print(f"  failed: {e}")
+        return None
+    return time.perf_counter() - start
+
+
+async def time_logins():
+    """Time the network steps the bot now runs in its background warm-up."""
+    from agents.bluesky import BlueskyPublisher
+    from agents.llama_3_2_ollama import LanguageModelWrapper
+
+    timings = {}
+    if os.getenv("BLUESKY_HANDLE") and os.getenv("BLUESKY_PASSWORD"):
+        publisher = BlueskyPublisher(
+            os.getenv("BLUESKY_HANDLE"), os.getenv("BLUESKY_PASSWORD")
+        )
+        timings["bluesky login"] = await time_step(publisher.login())
+
+    wrapper = LanguageModelWrapper()
+    timings["ollama warm-up"] = await time_step(wrapper.warm_up())
+    errors = await wrapper.warm_up_tools()
+    for tool, error in errors.items():
+        print(f"  {tool} warm-up failed: {error}")
+    timings.update({f"tool {step}": t for step, t in wrapper.tools.timings.items()})
+    await wrapper.close()
+    return timings
+
+
+def report(title, timings):
+    print(f"\n{title}")
+    for name, seconds in sorted(
+        timings.items(), key=lambda item: -(item[1] or 0)
+    ):
+        value = "unavailable" if seconds is None else f"{seconds * 1000:9.1f} ms"
+        print(f"  {name:<32} {value}")
+
+
+if __name__ == "__main__":
+    # Load environment variables from .env file
+    load_dotenv()
+
+    report("Cold imports (fresh interpreter each)", {m: time_import(m) for m in IMPORTS})
+    report("Logins and warm-up", asyncio.run(time_logins()))
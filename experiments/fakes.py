@@ -0,0 +1,498 @@
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import time
+import aiohttp
+from aiohttp import web
+
+# Local stand-ins for every service the bot talks to, so the whole pipeline can
+# be benchmarked offline. All of them are served from a single aiohttp app.
+
+POST_WORDS = (
+    "open source is how finance catches up with AI and OpenBB makes that "
+    "research workflow available to everyone who wants to build on it"
+).split()
+
+
+def _jwt(lifetime):
+    """Unsigned JWT with just enough claims for the atproto client"""
+
+    def encode(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode()).decode().rstrip("=")
+
+    payload = {"exp": int(time.time()) + lifetime, "sub": "did:plc:bench"}
+    return f"{encode({'alg': 'HS256'})}.{encode(payload)}.sig"
+
+
+class FakeOllama:
+    """/api/generate with a configurable per-token decode latency.
+
+    error_rate answers that share of generations with a 503, and while down
+    is set every request (health checks included) gets one, so the backend
+    pool's failover and recovery can be exercised.
+    """
+
+    def __init__(
+        self, token_latency=0.01, tokens=40, prompt_latency=0.05, error_rate=0.0
+    ):
+        self.token_latency = token_latency
+        self.tokens = tokens
+        self.prompt_latency = prompt_latency
+        self.error_rate = error_rate
+        self.down = False
+        self.requests = 0
+        # Requests answered with a 503
+        self.errors = 0
+        # Generations whose client went away before they finished
+        self.aborted = 0
+
+    def _unavailable(self, rate=0.0):
+        if self.down or random.random() < rate:
+            self.errors += 1
+            return web.Response(status=503, text="fake outage")
+        return None
+
+    def add_routes(self, app, prefix=""):
+        app.router.add_post(f"{prefix}/api/generate", self.generate)
+        app.router.add_post(f"{prefix}/api/embeddings", self.embeddings)
+        app.router.add_get(f"{prefix}/api/version", self.version)
+
+    async def embeddings(self, request):
+        """Hashed character trigrams, so near-identical prompts embed close"""
+        unavailable = self._unavailable()
+        if unavailable is not None:
+            return unavailable
+        body = await request.json()
+        text = f"  {body['prompt'].lower()} "
+        vector = [0.0] * 256
+        for i in range(len(text) - 2):
+            digest = hashlib.blake2b(text[i : i + 3].encode(), digest_size=2).digest()
+            vector[int.from_bytes(digest, "big") % len(vector)] += 1.0
+        await asyncio.sleep(self.prompt_latency / 5)
+        return web.json_response({"embedding": vector})
+
+    async def version(self, _request):
+        return self._unavailable() or web.json_response({"version": "0.0.0-fake"})
+
+    @staticmethod
+    def _route(topic):
+        # "Why" questions get background research, everything else none
+        if topic.lower().startswith("why"):
+            return {
+                "calls": [
+                    {"name": "perplexity_web_search", "arguments": {"query": topic}}
+                ]
+            }
+        return {"calls": []}
+
+    def _completion(self, prompt):
+        output = None
+        if "research assistant" in prompt and "Topics:" in prompt:
+            # Batched routing, one numbered topic per line
+            lines = prompt.rsplit("Topics:", 1)[1].strip().splitlines()
+            topics = [
+                line.split(". ", 1)[1] for line in lines if line[:1].isdigit()
+            ]
+            output = json.dumps({"routes": [self._route(t) for t in topics]})
+        elif "research assistant" in prompt and "Topic:" in prompt:
+            topic = prompt.rsplit("Topic:", 1)[1].strip()
+            output = json.dumps(self._route(topic))
+        if output is not None:
+            # About 4 characters per token
+            return [output[i : i + 4] for i in range(0, len(output), 4)]
+        return [f"{word} " for word in POST_WORDS[: self.tokens]]
+
+    async def generate(self, request):
+        self.requests += 1
+        # Fails before the first chunk, streamed or not
+        unavailable = self._unavailable(self.error_rate)
+        if unavailable is not None:
+            return unavailable
+        body = await request.json()
+        tokens = self._completion(body["prompt"])
+        limit = body.get("options", {}).get("num_predict")
+        if limit:
+            tokens = tokens[:limit]
+        stats = {
+            "prompt_eval_count": len(body["prompt"]) // 4,
+            "prompt_eval_duration": int(self.prompt_latency * 1e9),
+            "eval_count": len(tokens),
+            "eval_duration": int(len(tokens) * self.token_latency * 1e9),
+        }
+        await asyncio.sleep(self.prompt_latency)
+
+        if not body.get("stream", True):
+            for _ in tokens:
+                # Like Ollama, stop decoding once the client disconnects
+                if request.transport is None or request.transport.is_closing():
+                    self.aborted += 1
+                    return web.Response(status=499)
+                await asyncio.sleep(self.token_latency)
+            return web.json_response(
+                {"response": "".join(tokens), "done": True, **stats}
+            )
+
+        response = web.StreamResponse()
+        response.content_type = "application/x-ndjson"
+        await response.prepare(request)
+        try:
+            for token in tokens:
+                await asyncio.sleep(self.token_latency)
+                chunk = {"response": token, "done": False}
+                await response.write((json.dumps(chunk) + "\n").encode())
+            final = {"response": "", "done": True, **stats}
+            await response.write((json.dumps(final) + "\n").encode())
+        except ConnectionError:
+            # Client stopped reading, same as Ollama aborting the generation
+            self.aborted += 1
+        return response
+
+
+class FakeBluesky:
+    """Minimal XRPC server: session, profile and record writes."""
+
+    def __init__(self, latency=0.05, handle="bench.bsky.social"):
+        self.latency = latency
+        self.handle = handle
+        self.did = "did:plc:bench"
+        self.records = {}
+
+    def add_routes(self, app):
+        app.router.add_post("/xrpc/com.atproto.server.createSession", self.session)
+        app.router.add_post("/xrpc/com.atproto.server.refreshSession", self.session)
+        app.router.add_get("/xrpc/app.bsky.actor.getProfile", self.profile)
+        app.router.add_post("/xrpc/com.atproto.repo.createRecord", self.create_record)
+        app.router.add_post("/xrpc/com.atproto.repo.applyWrites", self.apply_writes)
+        app.router.add_get("/xrpc/com.atproto.repo.getRecord", self.get_record)
+
+    async def session(self, _request):
+        return web.json_response(
+            {
+                "did": self.did,
+                "handle": self.handle,
+                "accessJwt": _jwt(3600),
+                "refreshJwt": _jwt(86400),
+            }
+        )
+
+    async def profile(self, _request):
+        return web.json_response(
+            {"did": self.did, "handle": self.handle, "displayName": "Benchmark"}
+        )
+
+    def _store(self, rkey, value):
+        # Imported here so the Ollama/Telegram fakes work without atproto
+        from agents.bluesky import record_cid
+
+        uri = f"at://{self.did}/app.bsky.feed.post/{rkey}"
+        cid = record_cid(value)
+        self.records[rkey] = value
+        return uri, cid
+
+    async def create_record(self, request):
+        await asyncio.sleep(self.latency)
+        body = await request.json()
+        rkey = body.get("rkey") or f"{time.time_ns():x}{random.getrandbits(16):x}"
+        uri, cid = self._store(rkey, body["record"])
+        return web.json_response({"uri": uri, "cid": cid})
+
+    async def apply_writes(self, request):
+        await asyncio.sleep(self.latency)
+        body = await request.json()
+        results = []
+        for write in body["writes"]:
+            uri, cid = self._store(write["rkey"], write["value"])
+            results.append(
+                {
+                    "$type": "com.atproto.repo.applyWrites#createResult",
+                    "uri": uri,
+                    "cid": cid,
+                }
+            )
+        return web.json_response({"results": results})
+
+    async def get_record(self, request):
+        rkey = request.query.get("rkey")
+        if rkey not in self.records:
+            return web.json_response({"error": "RecordNotFound"}, status=400)
+        uri, cid = self._store(rkey, self.records[rkey])
+        return web.json_response(
+            {"uri": uri, "cid": cid, "value": self.records[rkey]}
+        )
+
+
+class FakeTelegram:
+    """Bot API methods the bot calls, recording the last text per message."""
+
+    def __init__(self, token="bench-token", latency=0.01):
+        self.token = token
+        self.latency = latency
+        self.texts = {}
+        # chat id -> time the bot sent its final reply in that chat
+        self.finished = {}
+        self._finished_changed = asyncio.Condition()
+        self._message_ids = iter(range(1, 1 << 31))
+
+    @staticmethod
+    def is_final(text):
+        return "posted to Bluesky" in text or text.startswith("Sorry")
+
+    async def _record(self, message_id, chat_id, text):
+        self.texts[message_id] = text
+        if self.is_final(text):
+            async with self._finished_changed:
+                self.finished[int(chat_id)] = time.perf_counter()
+                self._finished_changed.notify_all()
+
+    async def wait_finished(self, chat_id):
+        """Wait until the bot has sent its final reply in chat_id"""
+        async with self._finished_changed:
+            await self._finished_changed.wait_for(lambda: chat_id in self.finished)
+            return self.finished[chat_id]
+
+    def add_routes(self, app):
+        prefix = f"/bot{self.token}"
+        app.router.add_post(f"{prefix}/getMe", self.get_me)
+        app.router.add_post(f"{prefix}/sendMessage", self.send_message)
+        app.router.add_post(f"{prefix}/editMessageText", self.edit_message_text)
+        app.router.add_post(f"{prefix}/setWebhook", self.ok)
+        app.router.add_post(f"{prefix}/deleteWebhook", self.ok)
+
+    async def _params(self, request):
+        if request.content_type == "application/json":
+            return await request.json()
+        return dict(await request.post())
+
+    def _message(self, message_id, chat_id, text):
+        return {
+            "message_id": message_id,
+            "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"},
+            "text": text,
+        }
+
+    async def ok(self, _request):
+        return web.json_response({"ok": True, "result": True})
+
+    async def get_me(self, _request):
+        return web.json_response(
+            {
+                "ok": True,
+                "result": {
+                    "id": 1,
+                    "is_bot": True,
+                    "first_name": "Bench",
+                    "username": "bench_bot",
+                },
+            }
+        )
+
+    async def send_message(self, request):
+        await asyncio.sleep(self.latency)
+        params = await self._params(request)
+        message_id = next(self._message_ids)
+        await self._record(message_id, params["chat_id"], params["text"])
+        return web.json_response(
+            {
+                "ok": True,
+                "result": self._message(message_id, params["chat_id"], params["text"]),
+            }
+        )
+
+    async def edit_message_text(self, request):
+        await asyncio.sleep(self.latency)
+        params = await self._params(request)
+        message_id = int(params["message_id"])
+        await self._record(message_id, params["chat_id"], params["text"])
+        return web.json_response(
+            {
+                "ok": True,
+                "result": self._message(message_id, params["chat_id"], params["text"]),
+            }
+        )
+
+
+class FakeTelegramSender:
+    """Pushes updates to a webhook the way Telegram's servers do."""
+
+    def __init__(self, url, secret_token=None):
+        self.url = url
+        self.secret_token = secret_token
+        self._session = None
+
+    async def send(self, update):
+        """POST one update, returning the HTTP status the webhook answered"""
+        if self._session is None:
+            self._session = aiohttp.ClientSession()
+        headers = {}
+        if self.secret_token:
+            headers["X-Telegram-Bot-Api-Secret-Token"] = self.secret_token
+        async with self._session.post(self.url, json=update, headers=headers) as r:
+            return r.status
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+
+
+def _tail_latency(latency, slow_rate, slow_factor=10):
+    """latency, or slow_factor times it for a slow_rate share of requests"""
+    if random.random() < slow_rate:
+        return latency * slow_factor
+    return latency
+
+
+class FakeResearch:
+    """OpenAI-compatible /chat/completions used for Perplexity and Grok."""
+
+    def __init__(self, latency=0.5, slow_rate=0.0):
+        self.latency = latency
+        # Share of requests that take 10x longer, the tail hedging is for
+        self.slow_rate = slow_rate
+
+    def add_routes(self, app):
+        app.router.add_post("/research/chat/completions", self.completions)
+
+    async def completions(self, request):
+        await asyncio.sleep(_tail_latency(self.latency, self.slow_rate))
+        body = await request.json()
+        query = body["messages"][-1]["content"]
+        return web.json_response(
+            {
+                "id": "bench",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body["model"],
+                "choices": [
+                    {
+                        "index": 0,
+                        "finish_reason": "stop",
+                        "message": {
+                            "role": "assistant",
+                            "content": f"Background on {query} [1].",
+                        },
+                    }
+                ],
+            }
+        )
+
+
+class FakeOpenBB:
+    """Stands in for the obb app object behind the OpenBB tools."""
+
+    def __init__(self, latency=0.3, slow_rate=0.0):
+        self.latency = latency
+        self.slow_rate = slow_rate
+        self.news = self
+
+    def _articles(self, query, limit, symbols=""):
+        time.sleep(_tail_latency(self.latency, self.slow_rate))
+        return [
+            {
+                "id": f"{query}-{symbols}-{i}",
+                "date": "2025-01-01",
+                "title": f"{query} headline {i}",
+                "text": "Body.",
+                "symbols": symbols,
+            }
+            for i in range(limit)
+        ]
+
+    def world(self, query=None, limit=5, provider=None, **kwargs):
+        # Without a query this is the latest news, as pulled by the ingester
+        if query is None:
+            return self._latest(limit)
+        return self._articles(query, limit)
+
+    def company(self, query=None, limit=5, provider=None, symbol=None, **kwargs):
+        if symbol is not None:
+            return self._latest(limit, symbol.split(","))
+        return self._articles(query, limit, symbols=query)
+
+    def _latest(self, limit, symbols=()):
+        """Articles on the benchmark's topics and companies, spread over symbols"""
+        time.sleep(_tail_latency(self.latency, self.slow_rate))
+        topics = ["rate cuts", "open source models", "AI chips", "earnings"]
+        return [
+            {
+                "id": f"latest-{','.join(symbols)}-{i}",
+                "date": f"2025-01-{1 + i % 28:02d}",
+                "title": f"Latest news on {topics[i % len(topics)]}, story {i}",
+                "text": "Body.",
+                "symbols": symbols[i % len(symbols)] if symbols else "",
+            }
+            for i in range(limit)
+        ]
+
+
+class FakeServices:
+    """Serves every fake on one local port."""
+
+    def __init__(self, host="127.0.0.1", port=0, **latencies):
+        self.host = host
+        self.port = port
+        # Several Ollama hosts are served under /ollama<n> on the same port
+        self.ollamas = [
+            FakeOllama(
+                token_latency=latencies.get("token_latency", 0.01),
+                tokens=latencies.get("tokens", 40),
+                error_rate=latencies.get("ollama_error_rate", 0.0),
+            )
+            for _ in range(latencies.get("ollama_hosts", 1))
+        ]
+        self.ollama = self.ollamas[0]
+        self.bluesky = FakeBluesky(latency=latencies.get("bluesky_latency", 0.05))
+        self.telegram = FakeTelegram(latency=latencies.get("telegram_latency", 0.01))
+        tool_latency = latencies.get("tool_latency", 0.5)
+        slow_rate = latencies.get("tool_slow_rate", 0.0)
+        self.research = FakeResearch(latency=tool_latency, slow_rate=slow_rate)
+        self.openbb = FakeOpenBB(latency=tool_latency, slow_rate=slow_rate)
+        self._runner = None
+
+    @property
+    def url(self):
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def ollama_urls(self):
+        if len(self.ollamas) == 1:
+            return [self.url]
+        return [f"{self.url}/ollama{i}" for i in range(len(self.ollamas))]
+
+    def environment(self):
+        """Environment variables pointing the bot at these fakes"""
+        return {
+            "BLUESKY_HANDLE": self.bluesky.handle,
+            "BLUESKY_PASSWORD": "bench",
+            "BLUESKY_XRPC_URL": f"{self.url}/xrpc",
+            "TELEGRAM_BOT_TOKEN": self.telegram.token,
+            "TELEGRAM_BASE_URL": f"{self.url}/bot",
+            "OLLAMA_URLS": ",".join(self.ollama_urls),
+            "PERPLEXITY_BASE_URL": f"{self.url}/research",
+            "PERPLEXITY_API_KEY": "bench",
+            "GROK_BASE_URL": f"{self.url}/research",
+            "GROK_API_KEY": "bench",
+            "OPENBB_PAT": "bench",
+        }
+
+    async def start(self):
+        app = web.Application()
+        if len(self.ollamas) == 1:
+            self.ollama.add_routes(app)
+        else:
+            for i, ollama in enumerate(self.ollamas):
+                ollama.add_routes(app, prefix=f"/ollama{i}")
+        for fake in (self.bluesky, self.telegram, self.research):
+            fake.add_routes(app)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+        return self
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()